@@ -0,0 +1,145 @@
+"""Flood from every node as publisher, to map coverage and cost across a topology.
+
+`flood_all` runs one flood per source on a single precomputed topology: the
+CSR adjacency and the per-edge distances and hexagon delays (`EdgeGeometry`)
+are built once and sent once to each worker process. Sources are flooded in
+batches with `vector_engine.flood_many`, whose per-message state is sparse,
+so nothing is reset between floods. The results are per-source arrays that
+`PlotCanvas.plot_heatmap` can draw.
+
+Usage:
+    result = all_sources.flood_all(context, workers=8)
+    canvas.plot_heatmap(result.per_node(result.coverage * 100), "Coverage (%)")
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from config import Config
+import vector_engine
+
+BATCH_SIZE = 64
+
+
+class AllSourcesResult:
+    """Per-source results of `flood_all`; every array is aligned with `sources`.
+
+    Attributes:
+        sources (numpy.ndarray): Node indices (ID - 1) of the publishers.
+        received (numpy.ndarray): Nodes each message reached, its source included.
+        transmitted (numpy.ndarray): Transmissions of each message.
+        subscribers_received (numpy.ndarray): Subscribers of the topic each message
+            reached; None for plain OFP.
+    """
+
+    def __init__(self, sources, node_count, topic=None):
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.node_count = node_count
+        self.topic = topic
+        self.received = np.zeros(len(self.sources), dtype=np.int64)
+        self.transmitted = np.zeros(len(self.sources), dtype=np.int64)
+        self.subscribers_received = np.zeros(len(self.sources), dtype=np.int64) if topic is not None else None
+
+    @property
+    def coverage(self):
+        """Share of all nodes each message reached."""
+        return self.received / self.node_count if self.node_count else np.zeros(len(self.sources))
+
+    @property
+    def transmission_ratio(self):
+        """Share of all nodes that transmitted each message."""
+        return self.transmitted / self.node_count if self.node_count else np.zeros(len(self.sources))
+
+    def per_node(self, values, fill=np.nan):
+        """Spread per-source values over all nodes (by index), with `fill` for nodes that were no source."""
+        spread = np.full(self.node_count, fill, dtype=np.float64)
+        spread[self.sources] = values
+        return spread
+
+
+def flood_batch(store, sources, topic, threshold, transmission_range, scheduler="heap"):
+    """Flood one message from each of `sources` (node indices) on a shared timeline.
+
+    Returns:
+        tuple: Lists of (received, transmitted, subscribers_received) counts per source.
+    """
+    messages = [vector_engine.MessageFlood(f"msg{source}", source, topic, 0.0, store.node_count)
+                for source in sources.tolist()]
+    vector_engine.flood_many(store, messages, threshold, transmission_range, scheduler)
+    subscribers = store.subscribers(topic) if topic is not None else None
+    received, transmitted, subscribers_received = [], [], []
+    for message in messages:
+        reached = message.transmitted | message.nearest_tx.keys()
+        received.append(len(reached))
+        transmitted.append(len(message.transmitted))
+        if subscribers is not None:
+            subscribers_received.append(int(np.count_nonzero(subscribers[list(reached)])))
+    return received, transmitted, subscribers_received
+
+
+# Network and flood settings of a worker process, set once by `_init_worker`
+_worker_args = ()
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _run_batch(sources):
+    store, *settings = _worker_args
+    return flood_batch(store, sources, *settings)
+
+
+def flood_all(context=None, topic=None, sources=None, workers=None, batch_size=BATCH_SIZE, progress=None):
+    """Flood a message from every node (or each of `sources`) and collect per-source results.
+
+    Each flood makes exactly the decisions `send_new_message` would make for
+    that publisher.
+
+    Args:
+        context (SimulationContext, optional): Simulation to run in. Defaults to Config.
+        topic (str, optional): Topic to publish. Defaults to None (OFP mode).
+        sources (array-like, optional): Node indices to publish from. Defaults to every node.
+        workers (int, optional): Worker processes. Defaults to every core; 1 runs in this process.
+        batch_size (int): Sources flooded together per `flood_many` call and worker task.
+        progress (callable, optional): Called as `progress(done, total)` with the number of
+            floods finished after each batch. Raising from it (e.g. `SimulationCancelled`)
+            stops the run and cancels the batches not started yet.
+
+    Returns:
+        AllSourcesResult: The per-source results.
+    """
+    context = Config if context is None else context
+    store = context.network
+    sources = np.arange(store.node_count) if sources is None else np.asarray(sources, dtype=np.int64)
+    store.geometry(context.transmission_range)  # Built here once; the workers get it with the store
+    settings = (topic, context.get_threshold(), context.transmission_range, context.scheduler)
+    result = AllSourcesResult(sources, store.node_count, topic)
+    batches = [np.arange(start, min(start + batch_size, len(sources))) for start in range(0, len(sources), batch_size)]
+    done = 0
+
+    def collect(batch, counts):
+        nonlocal done
+        result.received[batch], result.transmitted[batch], subscribers_received = counts
+        if topic is not None:
+            result.subscribers_received[batch] = subscribers_received
+        done += len(batch)
+        if progress is not None:
+            progress(done, len(sources))
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(batches) <= 1:
+        for batch in batches:
+            collect(batch, flood_batch(store, sources[batch], *settings))
+        return result
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=_init_worker,
+                             initargs=(store,) + settings) as executor:
+        futures = {executor.submit(_run_batch, sources[batch]): batch for batch in batches}
+        try:
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return result
@@ -0,0 +1,305 @@
+"""Benchmarks for network setup, flooding, plotting and mobility at increasing scale.
+
+Times `setup_network`, the per-edge geometry build, a plain OFP flood, a
+topic flood, floods from a sample of sources over the `all_sources` process
+pool, `PlotCanvas.plot_network` and a random-walk `Mobility.step` (links and
+summaries kept up to date) for hex and random placement at several network
+sizes. The area grows with the node count so the density stays that of the
+default 50 nodes on 600 x 600. Each benchmark records its best time over a
+few repeats, events/sec for floods, and peak traced memory (from a separate
+run under `tracemalloc`, which would skew the timings).
+
+Usage:
+    python benchmark.py                               # run everything and print
+    python benchmark.py --save baseline.json          # store the results as a baseline
+    python benchmark.py --compare baseline.json       # flag regressions against it
+    python benchmark.py --sizes 100 1000 --benchmarks setup flood
+    python benchmark.py --compare benchmark_baseline.json  # against the committed baseline
+
+The plot benchmark times a redraw of an already plotted network (recolor and
+blit), which is what a flood animation does; it is skipped above
+`--max-plot-nodes` (100k by default).
+
+The mobility benchmark times a step after `MOBILITY_WARMUP` steps, once
+nodes get anchored again at a steady rate, and records its speedup over
+rebuilding the links from scratch with `build_adjacency`.
+
+Every result records the CPUs it used: one, except for `all_sources`, which
+uses a worker per CPU. With `--compare`, a benchmark regresses when its time
+or peak memory exceeds the baseline by more than `--tolerance` (default 25%),
+and the exit status is 1. Results on another CPU count than the baseline's
+are not compared.
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from config import SimulationContext
+from network_store import EdgeGeometry, link_radius
+import all_sources
+import ofp_simulation
+
+SIZES = (100, 1_000, 10_000, 100_000)
+PLACEMENTS = ("hex", "random")
+BENCHMARKS = ("setup", "geometry", "flood", "topic_flood", "all_sources", "plot", "mobility")
+DENSITY = 50 / 600 ** 2  # Nodes per unit area of the default configuration
+TOPIC_SAMPLES = 32  # Publishers tried per topic to find a topic flood that spreads
+MIN_TOPIC_REACH = 10  # Nodes the benchmarked topic flood must reach, else it only times the flood setup
+ALL_SOURCES_SAMPLE = 16  # Sources flooded by the all_sources benchmark, spread over the node indices
+ALL_SOURCES_BATCH = 2  # Sources per worker task, so the sample makes a task for each of up to 8 workers
+MAX_PLOT_NODES = 100_000
+MOBILITY_WARMUP = 50  # Steps before timing one, so nodes are anchored again at the rate of a long run
+MIN_TIME_DELTA = 0.001  # Slowdowns below this many seconds are timer noise, never regressions
+
+
+def make_context(size, placement, seed=0):
+    """Return a context for `size` nodes at the default density."""
+    return SimulationContext(seed=seed, node_count=size, area_width=math.sqrt(size / DENSITY),
+                             is_random=placement == "random")
+
+
+def topic_publisher(context, samples=TOPIC_SAMPLES, seed=0):
+    """Return (publisher ID, topic, nodes reached) of the widest topic flood among a sample.
+
+    A topic flood only travels through nodes that are not subscribed to the
+    topic but have subscribed neighbors, so from most publishers it dies after
+    the first broadcast. Up to `samples` such forwarding nodes are tried as the
+    publisher for every topic. Random placement at the default density is
+    barely connected, so its floods stay small whatever the publisher.
+    """
+    store = context.network
+    rng = np.random.default_rng(seed)
+    best = (None, None, -1)
+    for topic in context.topics:
+        columns = store.topic_columns(topic)
+        if columns is None:
+            continue
+        subscribed, neighbors_subscribed, bit = columns
+        forwarders = np.flatnonzero((subscribed & bit == 0) & (neighbors_subscribed & bit != 0))
+        for index in rng.choice(forwarders, min(samples, len(forwarders)), replace=False).tolist():
+            ofp_simulation.send_new_message(index + 1, topic, context=context)
+            reached = len(context.transmitting_nodes) + len(context.non_transmitting_nodes)
+            if reached > best[2]:
+                best = (index + 1, topic, reached)
+    return best
+
+
+def check_still_step(context, Mobility, RandomWalk):
+    """Raise if a mobility step that moves no node changes the network's links.
+
+    `Mobility` must link nodes exactly like `setup_network`; on the hex lattice,
+    neighbors sit right at the transmission range.
+    """
+    store = context.network
+    offsets, indices = store.offsets.copy(), store.indices.copy()
+    Mobility(context, RandomWalk(np.random.default_rng(0), 0.0)).step()
+    if not (np.array_equal(store.offsets, offsets) and np.array_equal(store.indices, indices)):
+        raise RuntimeError(f"A mobility step without movement changed the links ({len(indices)} -> "
+                           f"{len(store.indices)}).")
+
+
+def best_time(run, min_total=0.2, max_repeat=100):
+    """Return the best wall time of repeated calls of `run`.
+
+    Fast runs are repeated until they took `min_total` seconds overall, which
+    keeps millisecond timings stable; slower runs are timed once.
+    """
+    times = []
+    while not times or sum(times) < min_total and len(times) < max_repeat:
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(run):
+    """Return the peak memory traced while `run` executes, in bytes."""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def plot_canvas(context):
+    """Create an offscreen `PlotCanvas` for a context, or None without PyQt5."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from plot_network import PlotCanvas
+    except ImportError:
+        return None
+    plot_canvas.app = QApplication.instance() or QApplication(sys.argv[:1])
+    return PlotCanvas(context=context)
+
+
+def bench_case(size, placement, benchmarks, seed=0, max_plot_nodes=MAX_PLOT_NODES):
+    """Run the selected benchmarks for one size and placement.
+
+    Returns:
+        dict: Benchmark name -> {"seconds", "peak_bytes", "cpus"[, "events", "events_per_sec"]
+        [, "rebuild_seconds", "rebuild_speedup"]}.
+    """
+    context = make_context(size, placement, seed)
+    ofp_simulation.setup_network(context)
+    # The plain flood starts from the best connected node
+    publisher = int(np.argmax(np.diff(context.network.offsets))) + 1
+    topic_source, topic = None, None
+    if "topic_flood" in benchmarks:
+        topic_source, topic, reached = topic_publisher(context, seed=seed)
+        if reached <= MIN_TOPIC_REACH:
+            raise RuntimeError(f"No topic flood of {placement}/{size} reaches more than {MIN_TOPIC_REACH} nodes "
+                               f"(best: {reached}); the topic_flood benchmark would only time its setup.")
+
+    def flood(source, topic):
+        return lambda: ofp_simulation.send_new_message(source, topic, context=context)
+
+    ofp_simulation.send_new_message(publisher, None, context=context)  # Builds the geometry
+    runs = {
+        # A fresh context per call, so every repeat builds the same network
+        "setup": lambda: ofp_simulation.setup_network(make_context(size, placement, seed)),
+        "geometry": lambda: EdgeGeometry(context.network, context.transmission_range),
+        "flood": flood(publisher, None),
+        "topic_flood": flood(topic_source, topic),
+    }
+    cpus = {"all_sources": os.cpu_count() or 1}
+    sources = np.linspace(0, size - 1, min(ALL_SOURCES_SAMPLE, size)).astype(np.int64)
+    runs["all_sources"] = lambda: all_sources.flood_all(context, sources=sources, workers=cpus["all_sources"],
+                                                        batch_size=ALL_SOURCES_BATCH)
+    if "plot" in benchmarks and size <= max_plot_nodes:
+        canvas = plot_canvas(context)
+        if canvas is not None:
+            runs["plot"] = canvas.plot_network
+    if "mobility" in benchmarks:
+        # Last, since it moves the nodes
+        from mobility import Mobility, RandomWalk
+        check_still_step(context, Mobility, RandomWalk)
+        walk = RandomWalk(np.random.default_rng(seed), context.transmission_range / 20)
+        mobility = Mobility(context, walk)
+        runs["mobility"] = mobility.step
+
+    results = {}
+    for name in benchmarks:
+        if name not in runs:
+            continue
+        run = runs[name]
+        if name == "mobility":
+            mobility.run(MOBILITY_WARMUP)  # Only now, since it moves the nodes the other benchmarks use
+        seconds = best_time(run)
+        result = {"seconds": seconds, "peak_bytes": peak_memory(run), "cpus": cpus.get(name, 1)}
+        if name in ("flood", "topic_flood"):
+            run()
+            result["events"] = context.event_count
+            result["events_per_sec"] = context.event_count / seconds if seconds else 0.0
+        if name == "mobility":
+            scratch, radius = copy.deepcopy(context.network), link_radius(context.transmission_range)
+            result["rebuild_seconds"] = best_time(lambda: scratch.build_adjacency(radius))
+            result["rebuild_speedup"] = result["rebuild_seconds"] / seconds if seconds else 0.0
+        results[name] = result
+    return results
+
+
+def run_benchmarks(sizes=SIZES, placements=PLACEMENTS, benchmarks=BENCHMARKS, seed=0,
+                   max_plot_nodes=MAX_PLOT_NODES, report=print):
+    """Run the suite and return the results keyed by "benchmark/placement/size"."""
+    results = {}
+    for placement in placements:
+        for size in sizes:
+            for name, result in bench_case(size, placement, benchmarks, seed, max_plot_nodes).items():
+                key = f"{name}/{placement}/{size}"
+                results[key] = result
+                if report:
+                    report(format_result(key, result))
+    return results
+
+
+def format_result(key, result):
+    line = f"{key:<28} {result['seconds'] * 1000:>11.2f} ms {result['peak_bytes'] / 2 ** 20:>9.2f} MiB"
+    if "events_per_sec" in result:
+        line += f" {result['events_per_sec']:>13,.0f} events/s"
+    if result.get("cpus", 1) > 1:
+        line += f" on {result['cpus']} CPUs"
+    if "rebuild_speedup" in result:
+        line += f" {result['rebuild_speedup']:.2f}x rebuilding the links"
+    return line
+
+
+def environment():
+    """Describe the machine the benchmarks ran on, stored with a baseline."""
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Compare results with a baseline.
+
+    Results that used another number of CPUs than their baseline (see
+    `cpu_mismatches`) are skipped.
+
+    Returns:
+        list[str]: One message per regression (time or peak memory above the
+        baseline by more than `tolerance`; time also by more than `MIN_TIME_DELTA`).
+    """
+    regressions = []
+    skipped = set(cpu_mismatches(results, baseline))
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None or key in skipped:
+            continue
+        for field, label, floor in (("seconds", "time", MIN_TIME_DELTA), ("peak_bytes", "peak memory", 0)):
+            if result[field] > previous[field] * (1 + tolerance) and result[field] - previous[field] > floor:
+                regressions.append(f"{key}: {label} {result[field] / previous[field]:.2f}x baseline")
+    return regressions
+
+
+def cpu_mismatches(results, baseline):
+    """Return {key: (cpus, baseline cpus)} of the results that used another number of CPUs.
+
+    Baselines without per-result CPU counts ran everything on one.
+    """
+    return {key: (result.get("cpus", 1), baseline[key].get("cpus", 1)) for key, result in results.items()
+            if key in baseline and result.get("cpus", 1) != baseline[key].get("cpus", 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OFP setup, flooding and plotting.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--placements", nargs="+", choices=PLACEMENTS, default=PLACEMENTS)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-plot-nodes", type=int, default=MAX_PLOT_NODES, help="Skip plotting larger networks")
+    parser.add_argument("--save", metavar="FILE", help="Write the results to FILE as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare against the baseline in FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.placements, args.benchmarks, args.seed, args.max_plot_nodes)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        for key, (used, recorded) in cpu_mismatches(results, baseline["results"]).items():
+            print(f"Not compared: {key} used {used} CPUs, the baseline {recorded}.")
+        if baseline.get("environment") != environment():
+            print("Note: the baseline was recorded on a different environment.")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Command-line entry point for running simulations without the GUI.
+
+`run` imports only the simulation core (no PyQt5 or matplotlib), so it starts
+quickly and works on servers without a display. It sets up a network (or
+loads a snapshot), sends one message like the GUI's "Send" button and emits
+the GUI's metrics as JSON.
+
+Usage:
+    python cli.py run --node-count 500 --area-width 2000 --random --topic H --seed 7
+    python cli.py run --params params.json --output result.json --stats
+    python cli.py run --node-count 500 --topic H --trace flood.trace
+    python cli.py sweep spec.json results.csv
+    python cli.py tune spec.json --output tuned.json
+    python cli.py gui
+
+`--params` reads a JSON object of `SimulationContext` parameters; flags
+override it. As in the GUI, `threshold_ratio` is given without `epsilon`.
+`--trace` records the events of the last flood (the topic flood, or the OFP
+one without `--topic`) for replay, see `flood_trace.py`.
+"""
+import argparse
+import json
+import sys
+from config import Config, SimulationContext
+from flood_stats import FloodStats
+import flood_trace
+import ofp_simulation
+from metrics import compute_metrics
+
+# Flag -> SimulationContext parameter
+FLAGS = {
+    "node_count": int,
+    "area_width": float,
+    "transmission_range": float,
+    "threshold_ratio": float,
+    "placement": str,
+    "engine": str,
+    "scheduler": str,
+}
+
+
+def run(args):
+    """Run one simulation for the parsed `run` arguments and return the result dict."""
+    params = {}
+    if args.params:
+        with open(args.params) as f:
+            params.update(json.load(f))
+    params.update((name, getattr(args, name)) for name in FLAGS if getattr(args, name) is not None)
+    if args.random is not None:
+        params["is_random"] = args.random
+    if args.topics:
+        params["topics"] = [topic.strip() for topic in args.topics.split(",") if topic.strip()]
+    threshold_ratio = params.get("threshold_ratio", Config.threshold_ratio)
+    params["threshold_ratio"] = threshold_ratio - Config.epsilon
+
+    context = SimulationContext(seed=args.seed, **params)
+    if args.snapshot:
+        import snapshot
+        snapshot.load(args.snapshot, context)
+    else:
+        ofp_simulation.setup_network(context)
+
+    # Background OFP run for the pub-sub comparison, as in the GUI. A random
+    # publisher is drawn once and reused for the topic run.
+    ofp_stats = FloodStats() if args.stats else None
+    trace = flood_trace.TraceWriter(args.trace) if args.trace else None
+    try:
+        ofp_simulation.send_new_message(args.publisher, None, context=context, stats=ofp_stats,
+                                        trace=None if args.topic else trace)
+        ofp_transmissions = len(context.transmitting_nodes)
+        publisher = context.source_node_id
+        topic_stats = None
+        if args.topic:
+            topic_stats = FloodStats() if args.stats else None
+            ofp_simulation.send_new_message(publisher, args.topic, context=context, stats=topic_stats, trace=trace)
+    finally:
+        if trace is not None:
+            trace.close()
+
+    parameters = {name: getattr(context, name) for name in SimulationContext.PARAMETERS}
+    parameters["threshold_ratio"] = threshold_ratio
+    result = {
+        "parameters": parameters,
+        "seed": args.seed,
+        "snapshot": args.snapshot,
+        "publisher": publisher,
+        "topic": args.topic,
+        "metrics": compute_metrics(args.topic, ofp_transmissions, context),
+    }
+    if args.stats:
+        result["stats"] = {"ofp": ofp_stats.to_dict(), "topic": topic_stats.to_dict() if topic_stats else None}
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python cli.py", description="Run OFP simulations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run one simulation and print its metrics as JSON")
+    run_parser.add_argument("--params", metavar="FILE", help="JSON file of simulation parameters")
+    run_parser.add_argument("--snapshot", metavar="DIR", help="Load this topology snapshot instead of generating one")
+    for name, kind in FLAGS.items():
+        run_parser.add_argument("--" + name.replace("_", "-"), type=kind, default=None)
+    run_parser.add_argument("--random", action="store_true", default=None, help="Random node placement")
+    run_parser.add_argument("--topics", help="Comma-separated topics nodes subscribe to")
+    run_parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible run")
+    run_parser.add_argument("--publisher", type=int, default=None, help="Publisher node ID (default: random)")
+    run_parser.add_argument("--topic", default=None, help="Publish on this topic (default: plain OFP)")
+    run_parser.add_argument("--stats", action="store_true", help="Include flood counters and timings")
+    run_parser.add_argument("--output", metavar="FILE", help="Write the JSON here instead of stdout")
+    run_parser.add_argument("--trace", metavar="FILE", help="Record the last flood's events to this trace file")
+
+    commands.add_parser("sweep", help="Run a parameter sweep (see sweep.py)", add_help=False)
+    commands.add_parser("tune", help="Tune the threshold ratio for a delivery target (see tuner.py)", add_help=False)
+    commands.add_parser("gui", help="Start the graphical interface")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["sweep"]:
+        import sweep
+        return sweep.main(argv[1:])
+    if argv[:1] == ["tune"]:
+        import tuner
+        return tuner.main(argv[1:])
+    args = build_parser().parse_args(argv)
+    if args.command == "gui":
+        import interface
+        return interface.main()
+
+    try:
+        result = run(args)
+    except (OSError, TypeError, ValueError, KeyError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,68 @@
-class Config:
-    """Global configuration and state for simulation parameters."""
-    epsilon = 1e-6 # To get rid off percise floating point issues..
-    topics = ["H", "E", "L", "O"]
-    # Parameters
-    transmission_range = 100
-    threshold_ratio = 0.4
-    area_width = 600  # Width of the area (not squared)
-    node_count = 50
-    is_random = False
-
-    # Simulation State
-    nodes = {}  # Dictionary of nodes
-    transmitting_nodes = []
-    non_transmitting_nodes = []
-    not_received_nodes = []
-    message_id = None
-    source_node_id = None
-    strategicLast = 0
-    
-    @classmethod
-    def set_area(cls, width):
+import random
+
+
+class SimulationContext:
+    """Parameters, topology and results of one simulation.
+
+    Contexts are independent of each other, so several simulations can run in
+    one process (or one per thread). `Config` below is the default context used
+    by functions called without an explicit context; the GUI takes its initial
+    parameters from it and runs every network it sets up in a new context.
+    """
+
+    PARAMETERS = ("epsilon", "topics", "transmission_range", "threshold_ratio", "area_width",
+                  "node_count", "is_random", "engine", "scheduler", "placement", "placement_options")
+
+    def __init__(self, seed=None, **params):
+        """
+        Args:
+            seed (int, optional): Seed for this context's own random generator. Defaults to
+                None, which draws from the global `random` module like the GUI always has.
+                Bulk placements (see `topology.py`) seed a NumPy generator with it.
+            **params: Overrides for any of the parameters below.
+        """
+        self.epsilon = 1e-6 # To get rid off percise floating point issues..
+        self.topics = ["H", "E", "L", "O"]
+        # Parameters
+        self.transmission_range = 100
+        self.threshold_ratio = 0.4
+        self.area_width = 600  # Width of the area (not squared)
+        self.node_count = 50
+        self.is_random = False
+        self.engine = "vectorized"  # Flood engine: "vectorized" or "reference"
+        self.scheduler = "heap"  # Event queue: "heap" or "calendar"
+        self.placement = None  # Bulk generator from topology.PLACEMENTS; None uses is_random as always
+        self.placement_options = {}  # Extra arguments of the placement (e.g. min_distance)
+        for name, value in params.items():
+            if name not in self.PARAMETERS:
+                raise TypeError(f"Unknown simulation parameter {name!r}")
+            setattr(self, name, value)
+
+        self.seed = seed
+        self.random = random if seed is None else random.Random(seed)
+
+        # Simulation State
+        self.network = None  # NetworkStore holding topology and message state
+        self.nodes = {}  # Mapping of node ID to node (views over `network`)
+        self.transmitting_nodes = []
+        self.non_transmitting_nodes = []
+        self.not_received_nodes = []
+        self.message_id = None
+        self.source_node_id = None
+        self.event_count = 0  # Events processed by the last flood
+        self.strategicLast = 0
+        self.current_publisher = None  # Last publisher / topic, for resend_message
+        self.current_topic = None
+
+    def set_area(self, width):
         """Set the area and calculate the square value."""
-        cls.area_width = width
-        return cls.area_width ** 2
+        self.area_width = width
+        return self.area_width ** 2
 
-    @classmethod
-    def get_threshold(cls):
+    def get_threshold(self):
         """Calculate and return the threshold based on the threshold ratio."""
-        return cls.threshold_ratio * cls.transmission_range
+        return self.threshold_ratio * self.transmission_range
+
+
+# Default context of the module-level helpers (and the GUI's initial parameters)
+Config = SimulationContext()
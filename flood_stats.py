@@ -0,0 +1,67 @@
+import json
+import time
+
+
+class FloodStats:
+    """Counters and phase timings of one flood.
+
+    Pass an instance to `send_new_message(..., stats=stats)` to fill it. The
+    engines only touch it behind `if stats is not None`, so floods without
+    stats pay nothing for the instrumentation.
+
+    Counters:
+        events_pushed / events_popped: Scheduler traffic.
+        receptions: `receive_message` calls, i.e. one per neighbor of every transmitter.
+        threshold_discards: Receptions dropped because `dn < threshold`.
+        topic_rejections: Receptions past the threshold that the topic filter did not forward.
+        duplicate_suppressions: Popped events ignored by `transmit_message` because the
+            node had already transmitted (or is subscribed to the topic).
+    """
+
+    COUNTERS = ("events_pushed", "events_popped", "receptions", "threshold_discards", "topic_rejections",
+                "duplicate_suppressions")
+    PHASES = ("reset", "initial_broadcast", "event_loop", "results")
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.phase_seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.engine = None
+        self.scheduler = None
+        self.node_count = 0
+        self.transmissions = 0
+        self._last = None
+
+    def start(self):
+        """Start timing the first phase."""
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the last lap (or `start`) to `phase`."""
+        now = time.perf_counter()
+        self.phase_seconds[phase] += now - self._last
+        self._last = now
+
+    @property
+    def total_seconds(self):
+        return sum(self.phase_seconds.values())
+
+    def to_dict(self):
+        result = {"engine": self.engine, "scheduler": self.scheduler, "node_count": self.node_count,
+                  "transmissions": self.transmissions}
+        result.update((name, getattr(self, name)) for name in self.COUNTERS)
+        result["phase_seconds"] = dict(self.phase_seconds)
+        result["total_seconds"] = self.total_seconds
+        return result
+
+    def to_json(self, path=None):
+        """Return the stats as JSON, also writing them to `path` if given."""
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def __repr__(self):
+        counters = ", ".join(f"{name}={getattr(self, name)}" for name in self.COUNTERS)
+        return f"FloodStats({counters}, total_seconds={self.total_seconds:.6f})"
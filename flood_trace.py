@@ -0,0 +1,204 @@
+"""Binary event traces of a flood, for replaying how it spread.
+
+Pass a `TraceWriter` to `send_new_message(..., trace=writer)` and every
+reception, threshold discard, scheduled transmission and transmission of the
+flood is appended to a file as a fixed 32-byte record (`RECORD_DTYPE`). The
+writer fills a fixed-size buffer and writes it out whenever it is full, so a
+flood of millions of events never holds more than `BUFFER_RECORDS` of them in
+memory. Like `stats`, the engines only touch it behind `if trace is not None`.
+
+A trace file is a header (magic, format version, JSON metadata about the
+flood) followed by the records in the order they happened; their times never
+decrease. `TraceReader` memory-maps the records, and `TraceReplay` rebuilds
+the transmitted and received masks at any time of the flood from them,
+without running it again. Records of one transmission come in reception
+order from the reference engine and grouped by kind from the vectorized one;
+replays only depend on their times.
+
+Usage:
+    with flood_trace.TraceWriter("flood.trace") as writer:
+        ofp_simulation.send_new_message(1, "H", context=context, trace=writer)
+    replay = flood_trace.TraceReplay(flood_trace.TraceReader("flood.trace"))
+    transmitted, received = replay.state_at(0.1)
+"""
+import json
+import struct
+import numpy as np
+
+MAGIC = b"OFPTRACE"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII")  # Magic, format version, length of the JSON metadata that follows
+BUFFER_RECORDS = 65_536  # Records a writer holds before writing them out (2 MiB)
+REPLAY_CHUNK = 1 << 20  # Records a replay applies at a time
+
+# Record kinds
+RECEIVE = 0  # `node` heard `peer`; `value` is its distance to the nearest transmitter since
+DISCARD = 1  # `node` dropped the message because `value` (its distance) is below the threshold
+SCHEDULE = 2  # `node` will transmit at time `value` (event ID `event`), unless it has by then
+TRANSMIT = 3  # `node` transmitted
+KIND_NAMES = ("receive", "discard", "schedule", "transmit")
+
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"),  # Simulated time the record happened at
+    ("value", "<f8"),  # Distance (RECEIVE, DISCARD) or transmission time (SCHEDULE); NaN otherwise
+    ("node", "<i4"),  # Node index (ID - 1)
+    ("peer", "<i4"),  # Sending node index, -1 for TRANSMIT
+    ("kind", "<u4"),
+    ("event", "<i4"),  # Event ID of a SCHEDULE, -1 otherwise
+])
+
+
+class TraceWriter:
+    """Appends the records of one flood to a trace file through a fixed-size buffer.
+
+    The header is written by `begin`, which `send_new_message` calls once the
+    publisher is known. Close the writer (or use it as a context manager) to
+    write out the last records; a cancelled flood leaves a valid trace of what
+    happened until then.
+    """
+
+    def __init__(self, path, buffer_records=BUFFER_RECORDS):
+        self.path = path
+        self.file = open(path, "wb")
+        self.buffer = np.empty(buffer_records, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        self.records = 0  # Records written so far, buffered ones included
+        self.meta = None
+
+    def begin(self, **meta):
+        """Write the header with the flood's metadata (source, topic, node count...)."""
+        if self.meta is not None:
+            raise ValueError("A trace holds one flood; use a new TraceWriter for the next one.")
+        self.meta = meta
+        text = json.dumps(meta).encode()
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(text)) + text)
+
+    def record(self, kind, time, node, peer=-1, value=np.nan, event=-1):
+        """Append one record."""
+        if self.buffered == len(self.buffer):
+            self.flush()
+        self.buffer[self.buffered] = (time, value, node, peer, kind, event)
+        self.buffered += 1
+        self.records += 1
+
+    def record_many(self, kind, time, nodes, peer=-1, values=np.nan, events=-1):
+        """Append one record per node; `peer`, `values` and `events` are scalars or aligned arrays."""
+        count = len(nodes)
+        if not count:
+            return
+        if count > len(self.buffer) - self.buffered:
+            self.flush()
+        if count > len(self.buffer):
+            records = np.empty(count, dtype=RECORD_DTYPE)
+            target = records
+        else:
+            target = self.buffer[self.buffered:self.buffered + count]
+        target["time"] = time
+        target["value"] = values
+        target["node"] = nodes
+        target["peer"] = peer
+        target["kind"] = kind
+        target["event"] = events
+        if count > len(self.buffer):
+            self.file.write(records.tobytes())
+        else:
+            self.buffered += count
+        self.records += count
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.meta is None:
+            self.begin()  # No flood ran; still leave a readable (empty) trace
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TraceReader:
+    """Memory-mapped view of a trace file.
+
+    Attributes:
+        meta (dict): The metadata passed to `TraceWriter.begin`.
+        records (numpy.ndarray): Every record, read-only and memory-mapped (RECORD_DTYPE).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, meta_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an OFP trace")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported trace format {version} in {path}")
+            self.meta = json.loads(f.read(meta_length))
+            f.seek(0, 2)
+            size = f.tell()
+        offset = HEADER.size + meta_length
+        # A trace cut short (e.g. by a crash) ends in a partial record, which is left out
+        count = (size - offset) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    @property
+    def node_count(self):
+        return self.meta.get("node_count", 0)
+
+    @property
+    def end_time(self):
+        """Time of the last record (0 for an empty trace)."""
+        return float(self.records["time"][-1]) if len(self.records) else 0.0
+
+    def records_until(self, time):
+        """Return how many records happened at or before `time`."""
+        return int(np.searchsorted(self.records["time"], time, side="right"))
+
+    def __len__(self):
+        return len(self.records)
+
+
+class TraceReplay:
+    """Rebuilds a traced flood's state at any time.
+
+    Moving forward only applies the records in between; moving back starts
+    over from the beginning. Records are applied in chunks of
+    `REPLAY_CHUNK`, so memory stays bounded whatever the trace size.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.transmitted = np.zeros(reader.node_count, dtype=bool)
+        self.received = np.zeros(reader.node_count, dtype=bool)
+        self.applied = 0  # Records applied to the masks so far
+
+    def state_at(self, time):
+        """Return the (transmitted, received) masks after every record up to `time`.
+
+        The arrays belong to the replay and change on the next call.
+        """
+        end = self.reader.records_until(time)
+        if end < self.applied:
+            self.transmitted[:] = False
+            self.received[:] = False
+            self.applied = 0
+        records = self.reader.records
+        for start in range(self.applied, end, REPLAY_CHUNK):
+            chunk = records[start:min(start + REPLAY_CHUNK, end)]
+            kind, node = chunk["kind"], chunk["node"]
+            self.received[node[kind == RECEIVE]] = True
+            self.transmitted[node[kind == TRANSMIT]] = True
+        self.applied = end
+        return self.transmitted, self.received
@@ -1,13 +1,30 @@
+import os
+import shutil
 import sys
+import tempfile
+import time
+import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QComboBox, QLineEdit, QPushButton, QGridLayout, QMessageBox, QCheckBox,
-    QVBoxLayout, QSizePolicy, QHBoxLayout, QSplitter, QFrame
+    QVBoxLayout, QSizePolicy, QHBoxLayout, QSplitter, QFrame, QSlider, QFileDialog
 )
-from PyQt5.QtCore import Qt
-from config import Config
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+import all_sources
+from config import Config, SimulationContext
+import flood_trace
 import ofp_simulation
+from metrics import compute_metrics
+import result_cache
+from result_cache import ResultCache
 from plot_network import PlotCanvas  # Import the PlotCanvas
 
+# Heatmaps of an all-sources run: name -> per-source values and colorbar label of an AllSourcesResult
+HEATMAPS = {
+    "Coverage": lambda result: (result.coverage * 100, "Nodes reached (%)"),
+    "Transmissions": lambda result: (result.transmission_ratio * 100, "Nodes transmitted (%)"),
+}
+TIMELINE_STEPS = 1000  # Slider positions of the trace replay timeline
+
 
 class AspectRatioWidget(QWidget):
     def __init__(self, widget, aspect_ratio=1, parent=None):
@@ -30,9 +47,101 @@ class AspectRatioWidget(QWidget):
         super().resizeEvent(event)
 
 
+class SimulationWorker(QThread):
+    """Runs a network setup and/or the GUI's message floods off the GUI thread.
+
+    Emits `progress` with snapshots of the transmitted and received masks at
+    most every `PROGRESS_PERIOD` seconds, then exactly one of `done` (with the
+    metrics), `cancelled` or `failed`. Floods found in `cache` are restored
+    instead of being run again. With `all_sources`, it floods from every node
+    instead (see `all_sources.py`), emits `sources_done` after each batch and
+    `done` with the `AllSourcesResult`. With a `trace_path`, the last flood
+    (the topic flood, or the OFP one without a topic) is traced to that file.
+    """
+    PROGRESS_PERIOD = 0.25  # Wall-clock seconds between progress snapshots
+
+    progress = pyqtSignal(object, object)
+    sources_done = pyqtSignal(int, int)
+    done = pyqtSignal(object)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, context, publisher_id, topic, setup=False, cache=None, all_sources=False, trace_path=None,
+                 parent=None):
+        super().__init__(parent)
+        self.context = context
+        self.publisher_id = publisher_id
+        self.topic = topic
+        self.setup = setup
+        self.cache = ResultCache() if cache is None else cache
+        self.all_sources = all_sources
+        self.trace_path = trace_path
+        self.cancel_requested = False
+        self.last_report = 0.0
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def report(self, current_time):
+        """Progress callback of the floods: check for cancellation and send snapshots."""
+        if self.cancel_requested:
+            raise ofp_simulation.SimulationCancelled()
+        now = time.monotonic()
+        if now - self.last_report >= self.PROGRESS_PERIOD:
+            self.last_report = now
+            store = self.context.network
+            self.progress.emit(store.transmitted.copy(), store.nearest_tx != np.inf)
+
+    def report_sources(self, done, total):
+        """Progress callback of an all-sources run."""
+        if self.cancel_requested:
+            raise ofp_simulation.SimulationCancelled()
+        self.sources_done.emit(done, total)
+
+    def run(self):
+        context = self.context
+        try:
+            if self.setup:
+                ofp_simulation.setup_network(context)
+                if self.cancel_requested:
+                    raise ofp_simulation.SimulationCancelled()
+            if self.all_sources:
+                self.done.emit(all_sources.flood_all(context, self.topic, progress=self.report_sources))
+                return
+            self.last_report = time.monotonic()
+            trace = flood_trace.TraceWriter(self.trace_path) if self.trace_path else None
+            try:
+                # Run send message as normal OFP to calculate OFP Saved Transmissions. A random
+                # publisher is drawn once, so both floods start at the same node
+                publisher_id = result_cache.send_message(self.cache, self.publisher_id, None, context,
+                                                         progress=self.report, trace=None if self.topic else trace)
+                ofp_transmissions = len(context.transmitting_nodes)
+                if self.topic:
+                    # Run topic-based simulation
+                    result_cache.send_message(self.cache, publisher_id, self.topic, context, progress=self.report,
+                                              trace=trace)
+            finally:
+                if trace is not None:
+                    trace.close()
+            self.done.emit(compute_metrics(self.topic, ofp_transmissions, context))
+        except ofp_simulation.SimulationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class OFPSimulationApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.context = Config  # Context of the network on screen; every setup creates a new one
+        self.worker = None
+        self.pending_progress = None  # Latest progress snapshot not drawn yet
+        self.result_cache = ResultCache()  # Floods of the network on screen
+        self.all_sources_result = None  # Last all-sources run on the network on screen
+        self.trace_dir = tempfile.mkdtemp(prefix="ofp-traces-")  # Traces recorded by "Send new message"
+        self.trace_count = 0
+        self.trace_path = None  # Recorded trace on the timeline
+        self.timeline_end = 0.0  # Time of the timeline's last position
         self.initUI()
 
     def initUI(self):
@@ -72,6 +181,24 @@ class OFPSimulationApp(QWidget):
         send_button.clicked.connect(self.on_run_send)
         send_button.clicked.connect(self.remove_focus)
 
+        self.trace_checkbox = QCheckBox("Record trace")
+        self.trace_checkbox.setToolTip("Record the next message's events for the replay timeline")
+        open_trace_button = QPushButton('Open trace...')
+        open_trace_button.clicked.connect(self.on_open_trace)
+
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.on_cancel)
+
+        heatmap_label = QLabel("Heatmap:")
+        self.heatmap_dropdown = QComboBox()
+        self.heatmap_dropdown.addItems(HEATMAPS)
+        self.heatmap_dropdown.currentTextChanged.connect(self.show_heatmap)
+
+        all_sources_button = QPushButton('Flood from all sources')
+        all_sources_button.clicked.connect(self.on_run_all_sources)
+        all_sources_button.clicked.connect(self.remove_focus)
+
         # Horizontal line after send button
         send_line = QFrame()
         send_line.setFrameShape(QFrame.HLine)
@@ -108,8 +235,15 @@ class OFPSimulationApp(QWidget):
         input_layout.addWidget(self.topic_dropdown, 9, 1)
         input_layout.addWidget(publisher_label, 10, 0)
         input_layout.addWidget(self.publisher_dropdown, 10, 1)
-        input_layout.addWidget(send_button, 11, 0, 1, 2)
-        input_layout.addWidget(send_line, 12, 0, 1, 2)
+        input_layout.addWidget(self.trace_checkbox, 11, 0)
+        input_layout.addWidget(open_trace_button, 11, 1)
+        input_layout.addWidget(send_button, 12, 0, 1, 2)
+        input_layout.addWidget(heatmap_label, 13, 0)
+        input_layout.addWidget(self.heatmap_dropdown, 13, 1)
+        input_layout.addWidget(all_sources_button, 14, 0, 1, 2)
+        input_layout.addWidget(self.cancel_button, 15, 0, 1, 2)
+        input_layout.addWidget(send_line, 16, 0, 1, 2)
+        self.run_buttons = (setup_button, send_button, all_sources_button, open_trace_button)
 
         # Metrics label
         self.params_label = QLabel()
@@ -121,12 +255,30 @@ class OFPSimulationApp(QWidget):
         left_layout.addWidget(self.params_label)
 
         # Plot canvas
-        self.plot_canvas = PlotCanvas(self, width=5, height=5, on_run_send=self.on_run_send)
+        self.plot_canvas = PlotCanvas(self, width=5, height=5, on_run_send=self.on_run_send, context=self.context)
         self.plot_widget = AspectRatioWidget(self.plot_canvas, aspect_ratio=1.0)
 
+        # Replay timeline of a recorded trace, hidden until there is one
+        self.timeline_slider = QSlider(Qt.Horizontal)
+        self.timeline_slider.setRange(0, TIMELINE_STEPS)
+        self.timeline_slider.valueChanged.connect(self.on_timeline_changed)
+        self.timeline_label = QLabel()
+        self.timeline_widget = QWidget()
+        timeline_layout = QHBoxLayout(self.timeline_widget)
+        timeline_layout.setContentsMargins(0, 0, 0, 0)
+        timeline_layout.addWidget(self.timeline_slider)
+        timeline_layout.addWidget(self.timeline_label)
+        self.timeline_widget.hide()
+
+        right_widget = QWidget()
+        right_layout = QVBoxLayout(right_widget)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.addWidget(self.plot_widget, 1)
+        right_layout.addWidget(self.timeline_widget)
+
         splitter = QSplitter(Qt.Horizontal)
         splitter.addWidget(left_widget)
-        splitter.addWidget(self.plot_widget)
+        splitter.addWidget(right_widget)
         splitter.setStretchFactor(1, 1)
 
         main_layout = QHBoxLayout()
@@ -142,7 +294,7 @@ class OFPSimulationApp(QWidget):
         """Update the publisher dropdown with node IDs."""
         self.publisher_dropdown.clear()
         self.publisher_dropdown.addItem("Random")
-        self.publisher_dropdown.addItems([str(node.id) for node in Config.nodes.values()])
+        self.publisher_dropdown.addItems([str(node_id) for node_id in self.context.nodes])
 
     def remove_focus(self):
         self.area_width_input.clearFocus()
@@ -172,96 +324,230 @@ class OFPSimulationApp(QWidget):
 
             # Map "Random" to None for publisher
             publisher_id = None if publisher_text == "Random" else int(publisher_text)
-            
-            # Run send message as normal OFP to calculate OFP Saved Transmissions
-            ofp_simulation.send_new_message(publisher_id, None)
-            ofp_transmissions = len(Config.transmitting_nodes)
 
-            if topic:
-                # Run topic-based simulation
-                ofp_simulation.send_new_message(publisher_id, topic)
+            trace_path = None
+            if self.trace_checkbox.isChecked():
+                # A new file per trace: the one on the timeline is memory-mapped and must not be truncated
+                self.trace_count += 1
+                trace_path = os.path.join(self.trace_dir, f"flood-{self.trace_count}.trace")
+            self.start_worker(SimulationWorker(self.context, publisher_id, topic, cache=self.result_cache,
+                                               trace_path=trace_path))
 
-            # Plot the results
-            self.plot_canvas.plot_network()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
 
-            # Calculate metrics
-            total_nodes = Config.node_count
-            subscribers = [node for node in Config.nodes.values() if topic in node.subscribed_topics] if topic else Config.nodes.values()
-
-            # For topic-based pub/sub
-            if topic:
-                # Check if any subscriber received the message
-                subscribers_who_received = [
-                    node for node in subscribers if Config.message_id in node.transmitted or Config.message_id in node.distance_to_nearest_tx
-                ]
-                delivery_ratio = 100.0 if len(subscribers_who_received) > 0 else 0.0
-                non_receiving_nodes = len(subscribers) if delivery_ratio == 0 else 0
-                received_nodes = len(subscribers_who_received)
-                # Saved transmissions for topic-based pub/sub
-                saved_transmissions = ((total_nodes - len(Config.transmitting_nodes)) / total_nodes) * 100 \
-                    if total_nodes else 0
-                topic_saved_transmissions = (1 - ( len(Config.transmitting_nodes) / ofp_transmissions)) * 100 if ofp_transmissions else 0
-            else:
-                # For normal OFP broadcast
-                received_nodes = len(Config.transmitting_nodes) + len(Config.non_transmitting_nodes)
-                non_receiving_nodes = total_nodes - received_nodes  # Subtract received nodes from total nodes
-
-                delivery_ratio = (received_nodes / total_nodes) * 100 if total_nodes else 0
-                saved_transmissions = (len(Config.non_transmitting_nodes) / total_nodes) * 100 if total_nodes else 0
-                topic_saved_transmissions = None  # Not applicable for OFP
-
-            # Update the metrics label
-            metrics_text = f"""
-                <b>Metrics:</b><br>
-                Received: <b>{received_nodes}</b><br>
-                Not Received: <b>{non_receiving_nodes}</b><br>
-                Delivery Ratio: <b>{delivery_ratio:.2f}%</b><br>
-                <br>
-                Transmitted: <b>{len(Config.transmitting_nodes)}</b><br>
-                Transmition Ratio: <b>{(len(Config.transmitting_nodes) / Config.node_count * 100):.2f}%</b><br>
-                Saved Transmissions: <b>{saved_transmissions:.2f}%</b><br>
-            """
-            if topic:
-                metrics_text += f"""
-                <br>
-                Background <b>OFP</b> run for comparison purposes:<br>
-                OFP Transmitted: <b>{ofp_transmissions}</b><br>
-                OFP Transmition Ratio: <b>{(ofp_transmissions / Config.node_count * 100):.2f}%</b><br>
-                <br>
-                Pub-Sub Saved Transmissions: <b>{topic_saved_transmissions:.2f}%</b><br>
-                """
-
-            self.params_label.setText(metrics_text)
+    def on_run_all_sources(self):
+        """Flood from every node in the background, then show a heatmap of the results."""
+        topic = self.topic_dropdown.currentText()
+        topic = None if topic == "None" else topic
+        self.start_worker(SimulationWorker(self.context, None, topic, all_sources=True))
 
-        except Exception as e:
+    def on_open_trace(self):
+        """Replay a trace file (e.g. from `python cli.py run --trace`) on the network on screen."""
+        path, _ = QFileDialog.getOpenFileName(self, "Open trace", "", "Traces (*.trace);;All files (*)")
+        if path:
+            self.show_trace(path)
+
+    def show_trace(self, path):
+        """Put a trace on the replay timeline, at its end."""
+        try:
+            reader = self.plot_canvas.load_trace(path)
+        except (OSError, ValueError) as e:
             QMessageBox.critical(self, "Error", str(e))
+            return
+        self.drop_recorded_trace()
+        if os.path.dirname(path) == self.trace_dir:
+            self.trace_path = path
+        self.timeline_end = reader.end_time
+        self.timeline_widget.show()
+        if self.timeline_slider.value() == TIMELINE_STEPS:
+            self.on_timeline_changed(TIMELINE_STEPS)
+        else:
+            self.timeline_slider.setValue(TIMELINE_STEPS)
+
+    def hide_timeline(self):
+        self.timeline_widget.hide()
+        self.plot_canvas.replay = None
+        self.drop_recorded_trace()
+
+    def drop_recorded_trace(self):
+        """Delete the recorded trace that was on the timeline (a mapped file can be unlinked safely)."""
+        if self.trace_path is not None:
+            os.remove(self.trace_path)
+            self.trace_path = None
+
+    def remove_unused_trace(self, worker):
+        """Delete the trace of a run that was cancelled or failed."""
+        if worker.trace_path and os.path.exists(worker.trace_path):
+            os.remove(worker.trace_path)
+
+    def on_timeline_changed(self, value):
+        replay = self.plot_canvas.replay
+        if replay is None:
+            return
+        time = value / TIMELINE_STEPS * self.timeline_end
+        self.plot_canvas.show_trace_time(time)
+        self.timeline_label.setText(f"t = {time:.4f}  ({replay.applied} of {len(replay.reader)} events)")
+
+    def show_heatmap(self):
+        """Draw the heatmap selected in the dropdown for the last all-sources run."""
+        result = self.all_sources_result
+        if result is None or self.worker is not None:
+            return
+        values, label = HEATMAPS[self.heatmap_dropdown.currentText()](result)
+        self.plot_canvas.plot_heatmap(result.per_node(values), label)
+
+    def show_all_sources_summary(self, result):
+        """Update the metrics label with a summary of an all-sources run."""
+        coverage = result.coverage * 100
+        weakest = int(result.sources[coverage.argmin()]) + 1
+        self.params_label.setText(f"""
+            <b>All sources</b> ({result.topic or 'OFP'}):<br>
+            Sources: <b>{len(result.sources)}</b><br>
+            <br>
+            Mean Coverage: <b>{coverage.mean():.2f}%</b><br>
+            Lowest Coverage: <b>{coverage.min():.2f}%</b> (node {weakest})<br>
+            <br>
+            Mean Transmitted: <b>{result.transmitted.mean():.1f}</b><br>
+            Mean Transmition Ratio: <b>{result.transmission_ratio.mean() * 100:.2f}%</b><br>
+        """)
+
+    def show_metrics(self, topic, metrics):
+        """Update the metrics label."""
+        metrics_text = f"""
+            <b>Metrics:</b><br>
+            Received: <b>{metrics['received']}</b><br>
+            Not Received: <b>{metrics['not_received']}</b><br>
+            Delivery Ratio: <b>{metrics['delivery_ratio']:.2f}%</b><br>
+            <br>
+            Transmitted: <b>{metrics['transmitted']}</b><br>
+            Transmition Ratio: <b>{metrics['transmission_ratio']:.2f}%</b><br>
+            Saved Transmissions: <b>{metrics['saved_transmissions']:.2f}%</b><br>
+        """
+        if topic:
+            metrics_text += f"""
+            <br>
+            Background <b>OFP</b> run for comparison purposes:<br>
+            OFP Transmitted: <b>{metrics['ofp_transmitted']}</b><br>
+            OFP Transmition Ratio: <b>{metrics['ofp_transmission_ratio']:.2f}%</b><br>
+            <br>
+            Pub-Sub Saved Transmissions: <b>{metrics['pubsub_saved_transmissions']:.2f}%</b><br>
+            """
 
+        self.params_label.setText(metrics_text)
 
     def on_run_setup(self):
-        """Update Config and run the simulation."""
+        """Read the parameters and set up a new network (with a first message) in the background."""
         try:
-            # Update Config parameters from user input
-            Config.area_width = float(self.area_width_input.text())
-            Config.node_count = int(self.nodes_count_input.text())
-            Config.transmission_range = float(self.R_input.text())
-            Config.threshold_ratio = float(self.Th_input.text()) - Config.epsilon
-            Config.is_random = self.is_random_checkbox.isChecked()
-            Config.nodes = []
+            # New context from user input; the current network stays on screen until it is ready
+            context = SimulationContext(
+                area_width=float(self.area_width_input.text()),
+                node_count=int(self.nodes_count_input.text()),
+                transmission_range=float(self.R_input.text()),
+                threshold_ratio=float(self.Th_input.text()) - Config.epsilon,
+                is_random=self.is_random_checkbox.isChecked(),
+            )
+            self.start_worker(SimulationWorker(context, None, None, setup=True, cache=self.result_cache))
 
-            # Re-setup the network
-            ofp_simulation.setup_network()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
 
+    # Background runs
+    def start_worker(self, worker):
+        if self.worker is not None:
+            return  # A run is already in progress
+        self.worker = worker
+        self.hide_timeline()
+        worker.progress.connect(self.on_worker_progress)
+        worker.sources_done.connect(self.on_sources_done)
+        worker.done.connect(self.on_worker_done)
+        worker.cancelled.connect(self.on_worker_cancelled)
+        worker.failed.connect(self.on_worker_failed)
+        self.set_busy(True)
+        self.params_label.setText("<b>Running...</b>")
+        worker.start()
+
+    def set_busy(self, busy):
+        for button in self.run_buttons:
+            button.setEnabled(not busy)
+        self.cancel_button.setEnabled(busy)
+        self.plot_canvas.setEnabled(not busy)  # No topic edits while a flood runs
+
+    def finish_worker(self):
+        """Drop the finished worker; returns it."""
+        worker, self.worker = self.worker, None
+        worker.wait()
+        self.pending_progress = None
+        self.set_busy(False)
+        return worker
+
+    def on_cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def on_worker_progress(self, transmitted, received):
+        # Only the newest snapshot is drawn, however many arrive while the canvas is busy
+        if self.pending_progress is None:
+            QTimer.singleShot(0, self.draw_progress)
+        self.pending_progress = (transmitted, received)
+
+    def on_sources_done(self, done, total):
+        self.params_label.setText(f"<b>Running...</b> {done} of {total} sources")
+
+    def draw_progress(self):
+        if self.pending_progress is not None and self.worker is not None:
+            transmitted, received = self.pending_progress
+            self.pending_progress = None
+            self.plot_canvas.context = self.worker.context  # A setup draws its new network
+            self.plot_canvas.plot_network(transmitted, received)
+
+    def on_worker_done(self, metrics):
+        worker = self.finish_worker()
+        if worker.all_sources:
+            self.all_sources_result = metrics
+            self.show_heatmap()
+            self.show_all_sources_summary(metrics)
+            return
+        if worker.setup:
+            self.result_cache.invalidate(self.context.network)  # The old network is gone
+            self.all_sources_result = None
+            self.context = worker.context
+            self.plot_canvas.context = worker.context
             # Update the publisher dropdown
             self.update_publisher_dropdown()
-
-            # Automatically send a message after setup
-            self.on_run_send()
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
+        # Plot the results
+        if worker.trace_path:
+            self.show_trace(worker.trace_path)
+        else:
+            self.plot_canvas.plot_network()
+        self.show_metrics(worker.topic, metrics)
+
+    def on_worker_cancelled(self):
+        self.remove_unused_trace(self.finish_worker())
+        # What the message reached before it was cancelled, or the old network for a setup
+        self.plot_canvas.context = self.context
+        self.plot_canvas.plot_network()
+        self.params_label.setText("<b>Cancelled.</b>")
+
+    def on_worker_failed(self, message):
+        self.remove_unused_trace(self.finish_worker())
+        self.params_label.setText("")
+        QMessageBox.critical(self, "Error", message)
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        self.plot_canvas.replay = None
+        shutil.rmtree(self.trace_dir, ignore_errors=True)
+        super().closeEvent(event)
+
+
+def main():
+    app = QApplication(sys.argv)
+    ex = OFPSimulationApp()
+    return app.exec_()
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = OFPSimulationApp()
-    sys.exit(app.exec_())
+    sys.exit(main())
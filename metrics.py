@@ -0,0 +1,52 @@
+import numpy as np
+from config import Config
+
+
+def compute_metrics(topic=None, ofp_transmissions=None, context=None):
+    """Compute the metrics shown in the GUI for the last message sent.
+
+    Args:
+        topic (str, optional): Topic of the last message. None for plain OFP.
+        ofp_transmissions (int, optional): Transmissions of the background OFP run,
+            used for the pub-sub comparison in topic mode.
+        context (SimulationContext, optional): Simulation to read. Defaults to Config.
+
+    Returns:
+        dict: Received/not received counts, delivery ratio, transmissions and the
+        saved-transmission percentages, as displayed by `OFPSimulationApp`.
+    """
+    context = Config if context is None else context
+    store = context.network
+    total_nodes = context.node_count
+    transmitted = len(context.transmitting_nodes)
+    received = store.transmitted | (store.nearest_tx != np.inf)
+
+    if topic:
+        # Check if any subscriber received the message
+        subscribers = store.subscribers(topic)
+        subscriber_count = int(np.count_nonzero(subscribers))
+        received_nodes = int(np.count_nonzero(subscribers & received))
+        delivery_ratio = 100.0 if received_nodes > 0 else 0.0
+        non_receiving_nodes = subscriber_count if delivery_ratio == 0 else 0
+        # Saved transmissions for topic-based pub/sub
+        saved_transmissions = ((total_nodes - transmitted) / total_nodes) * 100 if total_nodes else 0
+        topic_saved_transmissions = (1 - (transmitted / ofp_transmissions)) * 100 if ofp_transmissions else 0
+    else:
+        # For normal OFP broadcast
+        received_nodes = transmitted + len(context.non_transmitting_nodes)
+        non_receiving_nodes = total_nodes - received_nodes
+        delivery_ratio = (received_nodes / total_nodes) * 100 if total_nodes else 0
+        saved_transmissions = (len(context.non_transmitting_nodes) / total_nodes) * 100 if total_nodes else 0
+        topic_saved_transmissions = None  # Not applicable for OFP
+
+    return {
+        "received": received_nodes,
+        "not_received": non_receiving_nodes,
+        "delivery_ratio": delivery_ratio,
+        "transmitted": transmitted,
+        "transmission_ratio": transmitted / total_nodes * 100 if total_nodes else 0,
+        "saved_transmissions": saved_transmissions,
+        "ofp_transmitted": ofp_transmissions,
+        "ofp_transmission_ratio": ofp_transmissions / total_nodes * 100 if total_nodes and ofp_transmissions is not None else None,
+        "pubsub_saved_transmissions": topic_saved_transmissions,
+    }
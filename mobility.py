@@ -0,0 +1,328 @@
+"""Time-stepped node movement with incremental neighbor maintenance.
+
+A mobility model moves every node at once on arrays; `Mobility` applies it
+to a context's network and keeps the CSR adjacency and the neighbor
+subscription summaries exact after every step, without rebuilding them:
+
+- Links use the same radius as `setup_network` (`link_radius`), so a
+  step that moves no node leaves the adjacency as it was.
+- Every node has an anchor, where it last got its candidates: the nodes
+  whose anchors are within that radius plus `skin` (a Verlet list per
+  node, found in a grid of anchors). While no node is more than
+  `skin / 2` from its anchor, no other pair can be within range, so only
+  the nodes that moved further are anchored again, each step.
+- A candidate pair can only be linked otherwise than at its anchors once
+  its nodes' distances from their anchors add up to its anchors'
+  distance from the radius; only those pairs are checked exactly.
+- Only nodes whose neighbors changed get their summaries recomputed.
+
+Floods run between steps as usual. To move nodes during a flood, pass
+`mobility.flood_progress()` as `progress` to `send_new_message` (with
+`progress_interval=mobility.dt`): both engines then see the links of the
+moment each transmission happens.
+
+Usage:
+    mobility = Mobility(context, RandomWaypoint(np.random.default_rng(7), 5, 20, pause=2))
+    mobility.run(100)
+    ofp_simulation.send_new_message(1, "H", context=context)
+"""
+import math
+import numpy as np
+from config import Config
+from network_store import link_radius, pairs_within, within
+
+# Grid cell keys are row * CELL_STRIDE + column, with room for any position
+CELL_STRIDE = 1 << 32
+CELL_OFFSET = 1 << 31
+
+
+def reflect(values, half_width):
+    """Fold coordinates that left [-half_width, half_width] back inside, as if bouncing off the edge."""
+    values = np.where(values > half_width, 2 * half_width - values, values)
+    return np.where(values < -half_width, -2 * half_width - values, values)
+
+
+class RandomWalk:
+    """Each step, every node moves `speed * dt` in a uniformly random direction, bouncing off the area's edges."""
+
+    def __init__(self, rng, speed):
+        self.rng = rng
+        self.speed = speed
+
+    def move(self, x, y, dt, width):
+        angle = self.rng.uniform(0, 2 * math.pi, len(x))
+        distance = self.speed * dt
+        return reflect(x + distance * np.cos(angle), width / 2), reflect(y + distance * np.sin(angle), width / 2)
+
+
+class RandomWaypoint:
+    """Every node travels in a straight line to a uniform random waypoint, pauses, then picks the next one.
+
+    Speeds are drawn uniformly from [min_speed, max_speed] per leg.
+    """
+
+    def __init__(self, rng, min_speed, max_speed, pause=0.0):
+        self.rng = rng
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.pause = pause
+        self.target_x = self.target_y = self.speed = self.pause_left = None
+
+    def new_legs(self, nodes, width):
+        self.target_x[nodes] = self.rng.uniform(-width / 2, width / 2, len(nodes))
+        self.target_y[nodes] = self.rng.uniform(-width / 2, width / 2, len(nodes))
+        self.speed[nodes] = self.rng.uniform(self.min_speed, self.max_speed, len(nodes))
+
+    def move(self, x, y, dt, width):
+        count = len(x)
+        if self.target_x is None or len(self.target_x) != count:
+            self.target_x, self.target_y = np.empty(count), np.empty(count)
+            self.speed, self.pause_left = np.empty(count), np.zeros(count)
+            self.new_legs(np.arange(count), width)
+
+        pausing = self.pause_left > 0
+        self.pause_left = np.maximum(self.pause_left - dt, 0)
+        dx, dy = self.target_x - x, self.target_y - y
+        remaining = np.hypot(dx, dy)
+        travel = self.speed * dt
+        arrived = ~pausing & (remaining <= travel)
+        moving = ~pausing & ~arrived
+        scale = np.divide(travel, remaining, out=np.zeros(count), where=moving)
+        x, y = x + dx * scale, y + dy * scale
+        x[arrived], y[arrived] = self.target_x[arrived], self.target_y[arrived]
+
+        arrived = np.flatnonzero(arrived)
+        self.pause_left[arrived] = self.pause
+        self.new_legs(arrived, width)
+        return x, y
+
+
+class Mobility:
+    """Moves the nodes of a context's network and keeps its adjacency up to date.
+
+    Args:
+        context (SimulationContext, optional): Simulation whose nodes move. Defaults to Config.
+        model: A mobility model with `move(x, y, dt, width) -> (x, y)`. Defaults to a
+            random walk at a tenth of the transmission range per time unit.
+        dt (float): Time per step.
+        skin (float, optional): Extra candidate distance. Defaults to half the transmission
+            range; larger skins refresh candidates less often but hold more of them.
+    """
+
+    def __init__(self, context=None, model=None, dt=1.0, skin=None):
+        self.context = Config if context is None else context
+        transmission_range = self.context.transmission_range
+        self.model = model or RandomWalk(np.random.default_rng(self.context.seed), transmission_range / 10)
+        self.dt = dt
+        self.skin = transmission_range / 2 if skin is None else skin
+        self.time = 0.0
+        self.steps = 0
+        self.refreshed = 0  # Nodes whose candidates were found again, over all steps
+        self.rechecked = 0  # Candidate pairs whose link was checked exactly, over all steps
+        self.rebuild()
+
+    def rebuild(self):
+        """Anchor every node where it is, find all candidate pairs and relink the network."""
+        store = self.context.network
+        count = store.node_count
+        self.radius = link_radius(self.context.transmission_range)
+        self.reach = self.radius + self.skin
+        self.anchor_x, self.anchor_y = store.x.copy(), store.y.copy()
+        cells = self.cells_of(np.arange(count))
+        self.grid_order = np.argsort(cells, kind="stable")
+        self.grid_keys = cells[self.grid_order]
+
+        # Candidates are unordered pairs in slots; a free slot holds the pair (count, count)
+        senders, receivers = pairs_within(store.x, store.y, self.reach)
+        lower = senders < receivers
+        self.first, self.second = senders[lower].astype(np.int32), receivers[lower].astype(np.int32)
+        self.margin, self.anchor_linked = self.anchor_state(self.first, self.second)
+        self.linked = self.anchor_linked.copy()
+        self.free = np.empty(0, dtype=np.int64)
+        self.update(np.zeros(count + 1))
+
+        # Links as sorted sender * count + receiver keys, in both directions
+        first, second = self.first[self.linked].astype(np.int64), self.second[self.linked].astype(np.int64)
+        self.links = np.sort(np.concatenate((first * count + second, second * count + first)))
+        self.set_links(None)
+
+    def cells_of(self, nodes):
+        """Return the grid cell keys of the anchors of `nodes`; cells are `reach` wide."""
+        cell_size = self.reach * (1 + 1e-9)
+        column = np.floor(self.anchor_x[nodes] / cell_size).astype(np.int64) + CELL_OFFSET
+        row = np.floor(self.anchor_y[nodes] / cell_size).astype(np.int64) + CELL_OFFSET
+        return row * CELL_STRIDE + column
+
+    def anchor_state(self, first, second):
+        """Return (margin, linked) of pairs at their nodes' anchors.
+
+        The margin is how far the anchors' distance is from the link radius,
+        less a little for rounding.
+        """
+        dx, dy = self.anchor_x[first] - self.anchor_x[second], self.anchor_y[first] - self.anchor_y[second]
+        distance = np.sqrt(dx * dx + dy * dy)
+        return np.abs(distance - self.radius) - self.radius * 1e-9, distance <= self.radius
+
+    def refresh(self, nodes):
+        """Anchor `nodes` where they are and find their candidates again.
+
+        Every pair of nodes whose anchors are within `reach` is a candidate.
+        As long as no node is more than `skin / 2` from its anchor, no other
+        pair can be within the link radius.
+
+        Returns:
+            numpy.ndarray: Former links of the nodes that are no candidates anymore, as
+            `first * count + second` keys.
+        """
+        store = self.context.network
+        count = store.node_count
+        self.anchor_x[nodes], self.anchor_y[nodes] = store.x[nodes], store.y[nodes]
+        self.refreshed += len(nodes)
+
+        # Move the nodes within the sorted grid
+        moving = np.zeros(count + 1, dtype=bool)
+        moving[nodes] = True
+        keep = ~moving[self.grid_order]
+        cells = self.cells_of(nodes)
+        order = np.argsort(cells, kind="stable")
+        cells, nodes = cells[order], nodes[order]
+        kept_keys = self.grid_keys[keep]
+        slots = np.searchsorted(kept_keys, cells)
+        self.grid_keys = np.insert(kept_keys, slots, cells)
+        self.grid_order = np.insert(self.grid_order[keep], slots, nodes)
+
+        # Their candidates: anchors in the 3x3 block of cells around theirs, within reach
+        found, partners = [], []
+        for row in (-1, 0, 1):
+            target = cells + row * CELL_STRIDE  # The three cells of a row are adjacent keys
+            start = np.searchsorted(self.grid_keys, target - 1, side="left")
+            counts = np.searchsorted(self.grid_keys, target + 1, side="right") - start
+            firsts = np.repeat(start - (np.cumsum(counts) - counts), counts)
+            found.append(np.repeat(nodes, counts))
+            partners.append(self.grid_order[firsts + np.arange(firsts.size)])
+        found, partners = np.concatenate(found), np.concatenate(partners)
+        dx, dy = self.anchor_x[found] - self.anchor_x[partners], self.anchor_y[found] - self.anchor_y[partners]
+        # Pairs of two refreshed nodes are found from both ends; keep the one from the lower node
+        near = np.flatnonzero((dx * dx + dy * dy <= self.reach * self.reach * (1 + 1e-9))
+                              & ((found < partners) | ~moving[partners]))
+        found, partners = found[near], partners[near]
+        new_pairs = np.sort(np.minimum(found, partners) * count + np.maximum(found, partners))
+        first, second = np.divmod(new_pairs, count)
+
+        # Free the nodes' old slots and fill free slots with the new pairs
+        old = np.flatnonzero(moving[self.first] | moving[self.second])
+        old_links = self.first[old].astype(np.int64) * count + self.second[old]
+        old_links = np.sort(old_links[self.linked[old]])
+        self.release(old)
+        slots = self.allocate(len(first))
+        self.first[slots], self.second[slots] = first, second
+        self.margin[slots], self.anchor_linked[slots] = self.anchor_state(first, second)
+
+        # Pairs start out as they were, so the update only reports real changes
+        position = np.searchsorted(old_links, new_pairs)
+        was_linked = np.zeros(len(new_pairs), dtype=bool)
+        inside = np.flatnonzero(position < len(old_links))
+        was_linked[inside] = old_links[position[inside]] == new_pairs[inside]
+        self.linked[slots] = was_linked
+        refound = np.zeros(len(old_links), dtype=bool)
+        refound[position[was_linked]] = True
+        return old_links[~refound]
+
+    def release(self, slots):
+        """Empty candidate `slots`: they never link and are never checked."""
+        self.first[slots] = self.second[slots] = self.context.network.node_count
+        self.margin[slots] = np.inf
+        self.anchor_linked[slots] = self.linked[slots] = False
+        self.free = np.concatenate((self.free, slots))
+
+    def allocate(self, size):
+        """Return `size` free candidate slots, adding empty ones when too few are free."""
+        missing = size - len(self.free)
+        if missing > 0:
+            added = np.arange(len(self.first), len(self.first) + max(missing, len(self.first) // 4))
+            self.first = np.concatenate((self.first, np.empty(len(added), dtype=np.int32)))
+            self.second = np.concatenate((self.second, np.empty(len(added), dtype=np.int32)))
+            self.margin = np.concatenate((self.margin, np.empty(len(added))))
+            for name in ("anchor_linked", "linked"):
+                setattr(self, name, np.concatenate((getattr(self, name), np.zeros(len(added), dtype=bool))))
+            self.release(added)
+        slots, self.free = self.free[len(self.free) - size:], self.free[:len(self.free) - size]
+        return slots
+
+    def update(self, offset):
+        """Bring the links of the candidate pairs up to date.
+
+        `offset` is every node's distance from its anchor, followed by a 0
+        for the free slots. A pair's distance is within its nodes' offsets
+        of the anchors' distance, so only pairs whose offsets add up to their
+        margin can be linked otherwise than at the anchors; only those are
+        checked exactly.
+
+        Returns:
+            numpy.ndarray: The slots whose link changed.
+        """
+        store = self.context.network
+        first, second = self.first, self.second
+        exact = np.flatnonzero(offset[first] + offset[second] >= self.margin)
+        linked = self.anchor_linked.copy()
+        linked[exact] = within(store.x[first[exact]] - store.x[second[exact]],
+                               store.y[first[exact]] - store.y[second[exact]], self.radius)
+        self.rechecked += len(exact)
+        changed = np.flatnonzero(linked != self.linked)
+        self.linked = linked
+        return changed
+
+    def set_links(self, changed):
+        """Write the links to the store as CSR; only `changed` nodes get new summaries."""
+        store = self.context.network
+        count = store.node_count
+        senders, receivers = np.divmod(self.links, count)
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(senders, minlength=count), out=offsets[1:])
+        store.set_links(offsets, receivers.astype(np.int32), changed)
+
+    def step(self, dt=None):
+        """Move every node by one time step and update the links."""
+        dt = self.dt if dt is None else dt
+        store = self.context.network
+        count = store.node_count
+        x, y = self.model.move(store.x, store.y, dt, self.context.area_width)
+        store.set_positions(x, y)
+        self.time += dt
+        self.steps += 1
+
+        # Nodes that may have come within range of a pair that is no candidate get new candidates
+        offset = np.zeros(count + 1)
+        offset[:count] = np.hypot(store.x - self.anchor_x, store.y - self.anchor_y)
+        far = np.flatnonzero(offset > self.skin / 2 * (1 - 1e-9))
+        gone = self.refresh(far) if far.size else np.empty(0, dtype=np.int64)
+        offset[far] = 0
+
+        changed = self.update(offset)
+        pairs = self.first[changed].astype(np.int64) * count + self.second[changed]
+        added, removed = pairs[self.linked[changed]], np.concatenate((pairs[~self.linked[changed]], gone))
+        if not (added.size or removed.size):
+            return
+        added = np.sort(np.concatenate((added, added % count * count + added // count)))
+        removed = np.sort(np.concatenate((removed, removed % count * count + removed // count)))
+        links = np.delete(self.links, np.searchsorted(self.links, removed))
+        self.links = np.insert(links, np.searchsorted(links, added), added)
+        self.set_links(np.concatenate((added, removed)) // count)
+
+    def run(self, steps):
+        """Advance `steps` time steps."""
+        for _ in range(steps):
+            self.step()
+
+    def advance_to(self, time):
+        """Take the steps that fall due up to `time`."""
+        while self.time + self.dt <= time:
+            self.step()
+
+    def flood_progress(self):
+        """Return a `progress` callback that moves the nodes along with a flood's clock.
+
+        The flood's time 0 is the current mobility time.
+        """
+        start = self.time
+        return lambda current_time: self.advance_to(start + current_time)
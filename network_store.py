@@ -0,0 +1,382 @@
+from collections.abc import Mapping
+import math
+import numpy as np
+
+LINK_EPSILON = 1e-6  # Slack on the range, so lattice neighbors exactly at the range are linked
+TOPIC_BLOCK_BITS = 64  # Topic bitsets are stored as rows of uint64 blocks
+GEOMETRY_CHUNK = 1 << 16  # Edges whose hexagon vertex offsets are held in memory at once
+# Arrays that describe the topology and subscriptions (everything but the message state)
+TOPOLOGY_ARRAYS = ("x", "y", "offsets", "indices", "sub_offsets", "sub_topics", "sub_bits", "neighbor_bits")
+
+# Unit hexagon around a center, computed exactly like ofp_simulation.strategic_points used to
+HEX_COS = np.array([math.cos(math.radians(angle_deg)) for angle_deg in range(0, 360, 60)])
+HEX_SIN = np.array([math.sin(math.radians(angle_deg)) for angle_deg in range(0, 360, 60)])
+
+
+def link_radius(transmission_range):
+    """Return the distance up to which two nodes are linked."""
+    return transmission_range + LINK_EPSILON
+
+
+def hypot(dx, dy):
+    """Element-wise `math.hypot`.
+
+    `np.hypot` can differ from `math.hypot` in the last bit, which is enough
+    to flip a threshold decision, so the reference function is mapped instead.
+    """
+    return np.fromiter(map(math.hypot, dx.tolist(), dy.tolist()), dtype=np.float64, count=len(dx))
+
+
+def within(dx, dy, radius):
+    """Return whether each offset `(dx, dy)` is at most `radius` long, exactly as `math.hypot` decides."""
+    squared, limit = dx * dx + dy * dy, radius * radius
+    inside = squared <= limit
+    # The squares are off by a few ulps at most, so only pairs right at the radius need math.hypot
+    borderline = np.flatnonzero(np.abs(squared - limit) <= limit * 1e-12)
+    inside[borderline] = hypot(dx[borderline], dy[borderline]) <= radius
+    return inside
+
+
+def nearest_distance(dx, dy):
+    """Return the smallest `math.hypot` of every row of offsets `(dx, dy)`, exactly.
+
+    The nearest offset of a row is found by its square, and only it gets
+    `math.hypot`; rows whose second nearest is within a few ulps of it get
+    `math.hypot` on every offset, like `within` does at the radius.
+    """
+    rows = np.arange(len(dx))
+    squared = dx * dx + dy * dy
+    nearest = squared.argmin(axis=1)
+    smallest = squared[rows, nearest]
+    distance = hypot(dx[rows, nearest], dy[rows, nearest])
+    squared[rows, nearest] = np.inf
+    tied = np.flatnonzero(squared.min(axis=1, initial=np.inf) - smallest <= smallest * 1e-12)
+    if tied.size:
+        distance[tied] = hypot(dx[tied].ravel(), dy[tied].ravel()).reshape(len(tied), -1).min(axis=1)
+    return distance
+
+
+def pairs_within(x, y, radius):
+    """Return every ordered pair `(i, j)`, `i != j`, of points at most `radius` apart.
+
+    Points are bucketed into grid cells slightly larger than `radius` and
+    sorted by cell, so the candidates of every point are the 3x3 block of
+    cells around it, found with `searchsorted`. Each unordered pair is only
+    tested once (the later points of the own cell and the four cells after
+    it) and then mirrored. Everything runs on arrays.
+
+    Returns:
+        tuple: (senders, receivers) index arrays, sorted by sender, then receiver.
+    """
+    count = len(x)
+    cell_size = radius * (1 + 1e-9)
+    cell_x = np.floor(x / cell_size).astype(np.int64)
+    cell_y = np.floor(y / cell_size).astype(np.int64)
+    if count:
+        cell_x -= cell_x.min() - 1  # Keep a free border so neighbor cells never wrap rows
+        cell_y -= cell_y.min() - 1
+    row_width = int(cell_x.max()) + 2 if count else 0
+    keys = cell_y * row_width + cell_x
+    # Work in cell order: queries then come sorted, which keeps searchsorted cache friendly
+    order = np.argsort(keys, kind="stable")
+    sorted_keys, sorted_x, sorted_y = keys[order], x[order], y[order]
+
+    senders, receivers = [], []
+    for offset in (0, 1, row_width - 1, row_width, row_width + 1):
+        target = sorted_keys + offset
+        # Points of a cell are contiguous, so "later in the own cell" starts right after the point
+        start = np.arange(1, count + 1) if offset == 0 else np.searchsorted(sorted_keys, target, side="left")
+        counts = np.searchsorted(sorted_keys, target, side="right") - start
+        firsts = np.repeat(start - (np.cumsum(counts) - counts), counts)
+        senders.append(np.repeat(np.arange(count), counts))
+        receivers.append(firsts + np.arange(firsts.size))
+    senders, receivers = np.concatenate(senders), np.concatenate(receivers)
+
+    linked = within(sorted_x[senders] - sorted_x[receivers], sorted_y[senders] - sorted_y[receivers], radius)
+    senders, receivers = order[senders[linked]], order[receivers[linked]]
+    # Mirror and sort the pairs as one int64 key each; much faster than lexsort on two columns
+    pair_keys = np.sort(np.concatenate((senders * count + receivers, receivers * count + senders)))
+    return np.divmod(pair_keys, max(count, 1))
+
+
+class EdgeGeometry:
+    """Flood geometry that only depends on the topology and the transmission range.
+
+    A receiver's delay is set by its distance to the nearest vertex of the
+    hexagon around the sender, so for a fixed topology every CSR edge has a
+    fixed delay. All of it is computed once here and reused by every flood.
+    Edges are processed `GEOMETRY_CHUNK` at a time, so only the per-edge
+    results take memory proportional to the edge count.
+    """
+
+    def __init__(self, store, transmission_range):
+        self.transmission_range = transmission_range
+        self.hex_dx = transmission_range * HEX_COS  # Hexagon vertex offsets from its center
+        self.hex_dy = transmission_range * HEX_SIN
+
+        edge_count = len(store.indices)
+        self.edge_length = np.empty(edge_count)
+        self.edge_strategic = np.empty(edge_count)  # Distance from the receiver to the nearest vertex
+        for start in range(0, edge_count, GEOMETRY_CHUNK):
+            edges = np.arange(start, min(start + GEOMETRY_CHUNK, edge_count))
+            senders = np.searchsorted(store.offsets, edges, side="right") - 1
+            receivers = store.indices[edges]
+            sender_x, sender_y = store.x[senders], store.y[senders]
+            receiver_x, receiver_y = store.x[receivers], store.y[receivers]
+            self.edge_length[edges] = hypot(receiver_x - sender_x, receiver_y - sender_y)
+            # Offsets to the vertices, computed like the reference engine does
+            self.edge_strategic[edges] = nearest_distance(receiver_x[:, None] - (sender_x[:, None] + self.hex_dx),
+                                                          receiver_y[:, None] - (sender_y[:, None] + self.hex_dy))
+
+        # Delay d = l / R when the sender is the source, l / (20R) otherwise
+        self.source_delay = self.edge_strategic / transmission_range
+        self.edge_delay = self.edge_strategic / (20 * transmission_range)
+
+
+class NetworkStore:
+    """Struct-of-arrays storage for a network topology and the current message state.
+
+    Node `i` (ID `i + 1`) has its position in `x[i]`, `y[i]`, its neighbors in
+    `indices[offsets[i]:offsets[i + 1]]` (CSR adjacency), and its subscribed
+    topics in `sub_topics[sub_offsets[i]:sub_offsets[i + 1]]` as interned topic
+    IDs. `sub_bits` holds the same subscriptions as a bitset row per node
+    (topic ID `t` is bit `t % 64` of block `t // 64`), and `neighbor_bits` the
+    union of the neighbors' bitsets, for fast forwarding checks. The
+    per-message state of the message in flight lives in the flat
+    `transmitted` and `nearest_tx` arrays.
+    """
+
+    def __init__(self, positions, subscriptions):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.x = np.ascontiguousarray(positions[:, 0])
+        self.y = np.ascontiguousarray(positions[:, 1])
+        self.node_count = len(self.x)
+
+        self.topic_names = []
+        self.topic_ids = {}
+        lengths = [len(topics) for topics in subscriptions]
+        self.sub_offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.sub_offsets[1:])
+        self.sub_bits = np.zeros((self.node_count, 1), dtype=np.uint64)
+        self.neighbor_bits = np.zeros_like(self.sub_bits)
+        self.sub_topics = np.array([self.intern_topic(topic) for topics in subscriptions for topic in topics],
+                                   dtype=np.int32)
+        self._fill_sub_bits()
+
+        self.offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.topology_version = 0  # Bumped whenever positions or adjacency change
+        self.subscription_version = 0  # Bumped whenever a node's topics change
+        self._geometry = None
+
+        self.message_id = None
+        self.transmitted = np.zeros(self.node_count, dtype=bool)
+        self.nearest_tx = np.full(self.node_count, np.inf)
+
+    @classmethod
+    def from_arrays(cls, x, y, topic_names, sub_offsets, sub_topics):
+        """Build a store from subscriptions already in CSR form (see `topology.py`).
+
+        `sub_topics` holds indices into `topic_names`, so no per-node Python
+        work is needed even for millions of nodes.
+        """
+        store = cls(np.column_stack((x, y)), [()] * len(x))
+        for topic in topic_names:
+            store.intern_topic(topic)
+        store.sub_offsets = np.asarray(sub_offsets, dtype=np.int64)
+        store.sub_topics = np.asarray(sub_topics, dtype=np.int32)
+        store._fill_sub_bits()
+        return store
+
+    @classmethod
+    def restore(cls, arrays, topic_names):
+        """Rebuild a store around saved `TOPOLOGY_ARRAYS` without copying them.
+
+        The arrays may be memory-mapped (see `snapshot.py`); they are used as
+        given, and only the per-message state is allocated.
+        """
+        store = cls.__new__(cls)
+        for name in TOPOLOGY_ARRAYS:
+            setattr(store, name, arrays[name])
+        store.node_count = len(store.x)
+        store.topic_names = list(topic_names)
+        store.topic_ids = {topic: topic_id for topic_id, topic in enumerate(store.topic_names)}
+        store.topology_version = 0
+        store.subscription_version = 0
+        store._geometry = None
+        store.message_id = None
+        store.transmitted = np.zeros(store.node_count, dtype=bool)
+        store.nearest_tx = np.full(store.node_count, np.inf)
+        return store
+
+    def _fill_sub_bits(self):
+        subscribers = np.repeat(np.arange(self.node_count), np.diff(self.sub_offsets))
+        self.sub_bits.fill(0)
+        np.bitwise_or.at(self.sub_bits, (subscribers, self.sub_topics // TOPIC_BLOCK_BITS),
+                         np.left_shift(np.uint64(1), (self.sub_topics % TOPIC_BLOCK_BITS).astype(np.uint64)))
+
+    # Topology
+    def build_adjacency(self, radius):
+        """Link every pair of nodes within `radius` of each other (CSR, neighbors in node order)."""
+        senders, receivers = pairs_within(self.x, self.y, radius)
+        offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(senders, minlength=self.node_count), out=offsets[1:])
+        self.set_links(offsets, receivers.astype(np.int32))
+
+    def set_links(self, offsets, indices, changed=None):
+        """Replace the CSR adjacency.
+
+        Args:
+            offsets, indices: The new CSR arrays (neighbors in node order).
+            changed (array-like, optional): Nodes whose neighbors changed; only their
+                subscription summaries are recomputed. Defaults to every node.
+        """
+        self.offsets = offsets
+        self.indices = indices
+        self.topology_version += 1
+        self.refresh_neighbor_bits(changed)
+
+    def set_positions(self, x, y):
+        """Move the nodes. Callers must rebuild the adjacency if links may have changed."""
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.topology_version += 1
+
+    def geometry(self, transmission_range):
+        """Return the cached `EdgeGeometry`, rebuilding it if the range or topology changed."""
+        key = (transmission_range, self.topology_version)
+        if self._geometry is None or self._geometry[0] != key:
+            self._geometry = (key, EdgeGeometry(self, transmission_range))
+        return self._geometry[1]
+
+    def neighbors_of(self, index):
+        """Return the neighbor indices of a node."""
+        return self.indices[self.offsets[index]:self.offsets[index + 1]]
+
+    def refresh_neighbor_bits(self, nodes=None):
+        """Recompute neighbor-subscription summaries by OR-reducing over the CSR rows.
+
+        Only the rows of `nodes` are recomputed if given, in place; otherwise every node's.
+        """
+        if nodes is None:
+            self.neighbor_bits = np.zeros_like(self.sub_bits)
+            has_neighbors = np.diff(self.offsets) > 0
+            if self.indices.size:
+                summaries = np.bitwise_or.reduceat(self.sub_bits[self.indices], self.offsets[:-1][has_neighbors],
+                                                   axis=0)
+                self.neighbor_bits[has_neighbors] = summaries
+            return
+
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        self.neighbor_bits[nodes] = 0
+        lengths = self.offsets[nodes + 1] - self.offsets[nodes]
+        nodes, lengths = nodes[lengths > 0], lengths[lengths > 0]
+        if len(nodes):
+            row_starts = np.cumsum(lengths) - lengths
+            edges = np.repeat(self.offsets[nodes] - row_starts, lengths) + np.arange(lengths.sum())
+            self.neighbor_bits[nodes] = np.bitwise_or.reduceat(self.sub_bits[self.indices[edges]], row_starts, axis=0)
+
+    # Topics
+    def intern_topic(self, topic):
+        """Return the integer ID of a topic, registering it (and growing the bitsets) if it is new."""
+        topic_id = self.topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = len(self.topic_names)
+            self.topic_ids[topic] = topic_id
+            self.topic_names.append(topic)
+            if topic_id >= self.sub_bits.shape[1] * TOPIC_BLOCK_BITS:
+                extra = np.zeros((self.node_count, 1), dtype=np.uint64)
+                self.sub_bits = np.hstack((self.sub_bits, extra))
+                self.neighbor_bits = np.hstack((self.neighbor_bits, extra))
+        return topic_id
+
+    def topic_columns(self, topic):
+        """Return `(subscribed, neighbors_subscribed, bit)` for checking one topic.
+
+        The first two are views of the bitset block holding the topic; a node
+        has the topic when `column[node] & bit` is non-zero. Returns None for no
+        topic or a topic no node has ever subscribed to.
+        """
+        topic_id = self.topic_ids.get(topic) if topic is not None else None
+        if topic_id is None:
+            return None
+        block = topic_id // TOPIC_BLOCK_BITS
+        return self.sub_bits[:, block], self.neighbor_bits[:, block], np.uint64(1 << topic_id % TOPIC_BLOCK_BITS)
+
+    def forwards(self, topic, nodes):
+        """Return whether each of `nodes` would forward a message on `topic` it receives.
+
+        A node forwards when it is not subscribed to the topic itself but a
+        neighbor is; this is all a topic flood depends on from subscriptions.
+        """
+        columns = self.topic_columns(topic)
+        if columns is None:
+            return np.zeros(len(nodes), dtype=bool)
+        subscribed, neighbors_subscribed, bit = columns
+        return ((subscribed[nodes] & bit) == 0) & ((neighbors_subscribed[nodes] & bit) != 0)
+
+    def subscribers(self, topic):
+        """Return a boolean array of the nodes subscribed to a topic."""
+        columns = self.topic_columns(topic)
+        if columns is None:
+            return np.zeros(self.node_count, dtype=bool)
+        subscribed, _, bit = columns
+        return (subscribed & bit) != 0
+
+    def _names_in(self, bits):
+        return [self.topic_names[block * TOPIC_BLOCK_BITS + offset]
+                for block, word in enumerate(bits.tolist())
+                for offset in range(TOPIC_BLOCK_BITS) if word >> offset & 1]
+
+    def topics_of(self, index):
+        """Return the subscribed topic names of a node, in subscription order."""
+        topic_ids = self.sub_topics[self.sub_offsets[index]:self.sub_offsets[index + 1]]
+        return [self.topic_names[topic_id] for topic_id in topic_ids.tolist()]
+
+    def set_topics(self, index, topics):
+        """Replace the subscribed topics of a node, updating the summaries of its neighbors."""
+        topic_ids = np.array([self.intern_topic(topic) for topic in topics], dtype=np.int32)
+        start, end = self.sub_offsets[index], self.sub_offsets[index + 1]
+        self.sub_topics = np.concatenate((self.sub_topics[:start], topic_ids, self.sub_topics[end:]))
+        self.sub_offsets[index + 1:] += len(topic_ids) - (end - start)
+        self.sub_bits[index] = 0
+        for topic_id in topic_ids.tolist():
+            self.sub_bits[index, topic_id // TOPIC_BLOCK_BITS] |= np.uint64(1 << topic_id % TOPIC_BLOCK_BITS)
+        self.refresh_neighbor_bits(self.neighbors_of(index))  # Only the neighbors' summaries can change
+        self.subscription_version += 1
+
+    def neighbor_topics_of(self, index):
+        """Return the set of topic names a node has learned from its neighbors."""
+        return set(self._names_in(self.neighbor_bits[index]))
+
+    # Message state
+    def clear_message_state(self):
+        """Forget the message in flight."""
+        self.message_id = None
+        self.transmitted.fill(False)
+        self.nearest_tx.fill(np.inf)
+
+    def nbytes(self):
+        """Return the memory held by the store's arrays, in bytes."""
+        arrays = [getattr(self, name) for name in TOPOLOGY_ARRAYS] + [self.transmitted, self.nearest_tx]
+        return sum(array.nbytes for array in arrays)
+
+
+class NodeMap(Mapping):
+    """Read-only `{node_id: Node}` mapping that creates node views on demand."""
+
+    def __init__(self, store, node_class, context):
+        self.store = store
+        self.node_class = node_class
+        self.context = context
+
+    def __getitem__(self, node_id):
+        if not isinstance(node_id, (int, np.integer)) or not 1 <= node_id <= self.store.node_count:
+            raise KeyError(node_id)
+        return self.node_class(self.store, int(node_id) - 1, self.context)
+
+    def __iter__(self):
+        return iter(range(1, self.store.node_count + 1))
+
+    def __len__(self):
+        return self.store.node_count
@@ -1,10 +1,20 @@
 import math
-import heapq
 import itertools
-import random
+import numpy as np
 from config import Config
+import flood_trace
+from network_store import HEX_COS, HEX_SIN, NetworkStore, NodeMap, link_radius
+from scheduler import PROGRESS_INTERVAL, TRANSMIT, make_scheduler
+import topology
+import vector_engine
 
-epsilon = 1e-6  # To get rid of precise floating-point issues
+ENGINES = ("vectorized", "reference")  # "reference" is the per-node engine, kept for validation
+ENGINE_VERSION = 1  # Bump when a change alters flood results; persistent caches (run_cache.py) key on it
+HEX_UNIT = list(zip(HEX_COS.tolist(), HEX_SIN.tolist()))  # Unit hexagon vertex offsets
+
+
+class SimulationCancelled(Exception):
+    """Raised by a progress callback to abort the flood in progress."""
 
 # Helper functions
 def distance(p1, p2):
@@ -12,110 +22,179 @@ def distance(p1, p2):
     return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
 
 
-def strategic_points(center):
+def strategic_points(center, transmission_range=None):
     """Calculate the strategic points (vertices of a hexagon) around a center."""
-    points = []
-    for angle_deg in range(0, 360, 60):
-        angle_rad = math.radians(angle_deg)
-        x = center[0] + Config.transmission_range * math.cos(angle_rad)
-        y = center[1] + Config.transmission_range * math.sin(angle_rad)
-        points.append((x, y))
-    return points
+    if transmission_range is None:
+        transmission_range = Config.transmission_range
+    return [(center[0] + transmission_range * cos, center[1] + transmission_range * sin)
+            for cos, sin in HEX_UNIT]
 
 class Node:
-    def __init__(self, node_id, position, subscribed_topics=None):
-        self.id = node_id
-        self.position = position
-        self.subscribed_topics = subscribed_topics or []  # List of subscribed topics
-        self.neighbor_subscriptions = set()  # Topics learned from neighbors
-        self.neighbors = []
-        self.transmitted = set()
-        self.distance_to_nearest_tx = {}
-
-    def add_neighbor(self, neighbor):
-        """Add a neighboring node within the transmission range and update subscriptions."""
-        self.neighbors.append(neighbor)
-        # Update neighbor subscriptions based on the new neighbor's topics
-        self.neighbor_subscriptions.update(neighbor.subscribed_topics)
-
-    def receive_message(self, topic, message_id, L2, from_node, current_time, event_queue, event_id_counter, source_position):
-        """Handle receiving a message."""
-        if message_id in self.transmitted:
+    """Lightweight view of one node in a `NetworkStore` owned by a `SimulationContext`."""
+    __slots__ = ("store", "index", "context")
+
+    def __init__(self, store, index, context):
+        self.store = store
+        self.index = index
+        self.context = context
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def id(self):
+        return self.index + 1
+
+    @property
+    def position(self):
+        return (float(self.store.x[self.index]), float(self.store.y[self.index]))
+
+    @property
+    def neighbors(self):
+        return [Node(self.store, index, self.context) for index in self.store.neighbors_of(self.index).tolist()]
+
+    @property
+    def subscribed_topics(self):
+        return self.store.topics_of(self.index)  # List of subscribed topics
+
+    @subscribed_topics.setter
+    def subscribed_topics(self, topics):
+        self.store.set_topics(self.index, topics)
+
+    @property
+    def neighbor_subscriptions(self):
+        return self.store.neighbor_topics_of(self.index)  # Topics learned from neighbors
+
+    @property
+    def transmitted(self):
+        """Message IDs this node has transmitted (only the message in flight is tracked)."""
+        return {self.store.message_id} if self.store.transmitted[self.index] else set()
+
+    @property
+    def distance_to_nearest_tx(self):
+        """Distance to the nearest transmitter, keyed by message ID."""
+        dn = self.store.nearest_tx[self.index]
+        return {self.store.message_id: float(dn)} if dn != math.inf else {}
+
+    def receive_message(self, topic, message_id, L2, from_node, current_time, event_queue, event_id_counter, source_position, edge=None, stats=None, trace=None):
+        """Handle receiving a message.
+
+        `edge` is the CSR index of the link from `from_node`; when given, the
+        distance and delay come from the store's precomputed edge geometry.
+        `stats` is an optional `FloodStats` to count the outcome in, `trace` an
+        optional `TraceWriter` to record it in.
+        """
+        store = self.store
+        geometry = None if edge is None else store.geometry(self.context.transmission_range)
+        if stats is not None:
+            stats.receptions += 1
+        if store.transmitted[self.index]:
             return  # Already transmitted this message
-        
+
         # Update distance to nearest transmitting node
-        dn = self.distance_to_nearest_tx.get(message_id, float('inf'))
-        dist_to_sender = distance(self.position, from_node.position)
+        dn = store.nearest_tx[self.index]
+        dist_to_sender = distance(self.position, from_node.position) if geometry is None else geometry.edge_length[edge]
         if dist_to_sender < dn:
-            self.distance_to_nearest_tx[message_id] = dist_to_sender
+            store.nearest_tx[self.index] = dist_to_sender
             dn = dist_to_sender
+        if trace is not None:
+            trace.record(flood_trace.RECEIVE, current_time, self.index, from_node.index, dn)
 
         # Check if the message should be discarded
-        if dn < Config.get_threshold():
+        if dn < self.context.get_threshold():
+            if stats is not None:
+                stats.threshold_discards += 1
+            if trace is not None:
+                trace.record(flood_trace.DISCARD, current_time, self.index, from_node.index, dn)
             return
 
         # Calculate delay based on distance and strategic points
-        if from_node.position == source_position:
-            hex_center = source_position
+        if geometry is not None:
+            # The hexagon is always centered on the sender, so the delay is fixed per edge
+            d = (geometry.source_delay if from_node.position == source_position else geometry.edge_delay)[edge]
         else:
-            hex_center = L2
+            if from_node.position == source_position:
+                hex_center = source_position
+            else:
+                hex_center = L2
 
-        l = min(distance(self.position, sp) for sp in strategic_points(hex_center))
-        d = l / (Config.transmission_range if from_node.position == source_position else 20 * Config.transmission_range)
+            transmission_range = self.context.transmission_range
+            l = min(distance(self.position, sp) for sp in strategic_points(hex_center, transmission_range))
+            d = l / (transmission_range if from_node.position == source_position else 20 * transmission_range)
 
         # Schedule transmission after delay d
         transmission_time = current_time + d
         event_id = next(event_id_counter)
 
         # Check forwarding conditions
+        columns = store.topic_columns(topic)
         should_forward = (
-            not topic in self.subscribed_topics and
-            topic in self.neighbor_subscriptions
+            columns is not None and
+            not columns[0][self.index] & columns[2] and
+            columns[1][self.index] & columns[2]
         ) or topic == None
 
         if should_forward:
             # Forward to neighbors
-            heapq.heappush(event_queue, (transmission_time, event_id, self.transmit_message, topic, message_id, source_position))
-
-    def transmit_message(self, topic, message_id, source_position, event_queue, current_time, event_id_counter):
+            event_queue.push((transmission_time, event_id, self.index, TRANSMIT, message_id))
+            if trace is not None:
+                trace.record(flood_trace.SCHEDULE, current_time, self.index, from_node.index, transmission_time,
+                             event_id)
+        elif stats is not None:
+            stats.topic_rejections += 1
+
+    def transmit_message(self, topic, message_id, source_position, event_queue, current_time, event_id_counter, stats=None, trace=None):
         """Transmit a message to neighbors."""
-        if message_id in self.transmitted or topic in self.subscribed_topics:
+        store = self.store
+        columns = store.topic_columns(topic)
+        if store.transmitted[self.index] or columns is not None and columns[0][self.index] & columns[2]:
+            if stats is not None:
+                stats.duplicate_suppressions += 1
             return
 
-        self.transmitted.add(message_id)
-        self.distance_to_nearest_tx[message_id] = 0  # Reset dn
-
-        for neighbor in self.neighbors:
-            neighbor.receive_message(topic, message_id, self.position, self, current_time, event_queue, event_id_counter, source_position)
-
-        # Propagate subscription knowledge to neighbors
-        for neighbor in self.neighbors:
-            neighbor.neighbor_subscriptions.update(self.subscribed_topics)
-
-def setup_network():
-    """Set up the network using global parameters from Config."""
-    # Update Config with results
-    Config.transmitting_nodes = []
-    Config.non_transmitting_nodes = []
-    Config.not_received_nodes = []
+        store.transmitted[self.index] = True
+        store.nearest_tx[self.index] = 0  # Reset dn
+        if trace is not None:
+            trace.record(flood_trace.TRANSMIT, current_time, self.index)
+
+        first_edge = int(store.offsets[self.index])
+        for edge, neighbor in enumerate(self.neighbors, start=first_edge):
+            neighbor.receive_message(topic, message_id, self.position, self, current_time, event_queue, event_id_counter, source_position, edge=edge, stats=stats, trace=trace)
+
+def setup_network(context=None):
+    """Set up the network using the parameters of a context (defaults to Config)."""
+    context = Config if context is None else context
+    random = context.random
+    # Update the context with results
+    context.transmitting_nodes = []
+    context.non_transmitting_nodes = []
+    context.not_received_nodes = []
     
-    transmission_range = Config.transmission_range
-    area = Config.set_area(Config.area_width)
-    node_count = Config.node_count
-    is_random = Config.is_random
+    transmission_range = context.transmission_range
+    area = context.set_area(context.area_width)
+    node_count = context.node_count
+    is_random = context.is_random
 
-    nodes = []
-    node_dict = {}
+    positions = []
+    subscriptions = []
     width = height = math.sqrt(area)
     id_counter = 1
 
-    if is_random:
+    if context.placement is not None:
+        store, lattice_count = topology.generate_store(
+            np.random.default_rng(context.seed), context.placement, node_count, width, transmission_range,
+            context.topics, **context.placement_options)
+        # Without a lattice any node but the last may be picked as source, as with is_random
+        context.strategicLast = lattice_count + 1 if lattice_count else node_count
+    elif is_random:
         for id_counter in range(1, node_count + 1):
             pos = (random.uniform(-width / 2, width / 2),
                    random.uniform(-height / 2, height / 2))
-            subscribed_topics = assign_random_topics()
-            node_dict[id_counter] = Node(id_counter, pos, subscribed_topics)
-            nodes.append(node_dict[id_counter])
+            positions.append(pos)
+            subscriptions.append(assign_random_topics(context))
     else:
         hex_height = transmission_range / 2 * math.sqrt(3)
         x_offset = -width / 2
@@ -132,42 +211,58 @@ def setup_network():
                 x_pos = x + x_shift + x_offset
                 y_pos = y + y_offset
                 if -width / 2 <= x_pos <= width / 2 and -height / 2 <= y_pos <= height / 2:
-                    pos = (x_pos, y_pos)
-                    subscribed_topics = assign_random_topics()
-                    node_dict[id_counter] = Node(id_counter, pos, subscribed_topics)
-                    nodes.append(node_dict[id_counter])
+                    positions.append((x_pos, y_pos))
+                    subscriptions.append(assign_random_topics(context))
                     id_counter += 1
                 x += transmission_range
             y += hex_height
             row_number += 1
         
-        Config.strategicLast = id_counter
+        context.strategicLast = id_counter
         # Fill remaining nodes randomly if necessary
         while id_counter <= node_count:
             pos = (random.uniform(-width / 2, width / 2),
                    random.uniform(-height / 2, height / 2))
-            subscribed_topics = assign_random_topics()
-            node_dict[id_counter] = Node(id_counter, pos, subscribed_topics)
-            nodes.append(node_dict[id_counter])
+            positions.append(pos)
+            subscriptions.append(assign_random_topics(context))
             id_counter += 1
 
-    # Establish neighbors
-    for node in nodes:
-        for other_node in nodes:
-            if node != other_node and distance(node.position, other_node.position) <= transmission_range + epsilon:
-                node.add_neighbor(other_node)
+    if context.placement is None:
+        store = NetworkStore(positions, subscriptions)
+    # Establish neighbors (CSR adjacency built over a spatial grid)
+    store.build_adjacency(link_radius(transmission_range))
 
-    Config.nodes = node_dict
+    context.network = store
+    context.nodes = NodeMap(store, Node, context)
 
 
-def assign_random_topics():
-    topics = Config.topics
+def assign_random_topics(context=None):
+    context = Config if context is None else context
+    random = context.random
+    topics = context.topics
     # 20% chance to have no topics, otherwise random selection
     if random.random() < 0.05:
         return []  # Node acts as a publisher only
     return random.sample(topics, k=random.randint(1, len(topics)))
 
-def send_new_message(publisher_id=None, topic=None):
+def select_source(publisher_id=None, context=None):
+    """Return the publisher node, or pick a random source if no publisher is given."""
+    context = Config if context is None else context
+    random = context.random
+    if publisher_id:
+        source_node = context.nodes.get(publisher_id)
+        if not source_node:
+            raise ValueError(f"Publisher ID {publisher_id} not found.")
+    elif context.is_random:
+        index = random.randint(1, context.node_count - 1)
+        source_node = context.nodes[index]
+    else:
+        index = random.randint(1, context.strategicLast - 1)  # Select a deterministic node
+        source_node = context.nodes[index]
+    return source_node
+
+def send_new_message(publisher_id=None, topic=None, engine=None, context=None, stats=None, progress=None,
+                     progress_interval=PROGRESS_INTERVAL, trace=None):
     """
     Send a new message using OFP or topic-based pub/sub.
     
@@ -175,59 +270,127 @@ def send_new_message(publisher_id=None, topic=None):
         publisher_id (int, optional): ID of the publisher node. Defaults to None.
         sender_id (int, optional): ID of the node sending the message. Defaults to None.
         topic (str, optional): Topic to publish. Defaults to None (OFP mode).
+        engine (str, optional): "vectorized" or "reference". Defaults to the context's engine.
+        context (SimulationContext, optional): Simulation to run in. Defaults to Config.
+        stats (FloodStats, optional): Filled with the flood's counters and phase timings.
+        progress (callable, optional): Called as `progress(current_time)` about every
+            `progress_interval` of simulated time while the flood runs; the context's
+            network then holds the state at that time. Raise `SimulationCancelled`
+            from it to stop the flood; the results then describe the partial flood.
+        trace (TraceWriter, optional): Gets every reception, discard, scheduled transmission
+            and transmission of the flood (see `flood_trace.py`). It is not closed here.
     """
-    global current_publisher
-    current_publisher = publisher_id
-    global current_topic
-    current_topic = topic
+    context = Config if context is None else context
+    random = context.random
+    engine = engine or context.engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}.")
+    if stats is not None:
+        stats.start()
+
+    context.current_publisher = publisher_id
+    context.current_topic = topic
     
     # Reset node states
-    for node in Config.nodes.values():
-        node.transmitted.clear()  # Clear transmitted messages
-        node.distance_to_nearest_tx.clear()  # Reset nearest transmitter distances
+    store = context.network
+    store.clear_message_state()
 
-    # Reset Config states
-    Config.transmitting_nodes = []
-    Config.non_transmitting_nodes = []
-    Config.not_received_nodes = []
+    # Reset context states
+    context.transmitting_nodes = []
+    context.non_transmitting_nodes = []
+    context.not_received_nodes = []
 
-    event_queue = []
+    event_queue = make_scheduler(context.scheduler)
     current_time = 0.0
     event_id_counter = itertools.count()
 
     # Select source node
-    if publisher_id:
-        source_node = Config.nodes.get(publisher_id)
-        if not source_node:
-            raise ValueError(f"Publisher ID {publisher_id} not found.")
-    elif Config.is_random:
-        index = random.randint(1, Config.node_count - 1)
-        source_node = Config.nodes[index]
-    else:
-        index = random.randint(1, Config.strategicLast - 1)  # Select a deterministic node
-        source_node = Config.nodes[index]
+    source_node = select_source(publisher_id, context)
 
-    Config.message_id = f'msg{random.randint(1, 1000)}'  # Unique message ID
-    Config.source_node_id = source_node.id
+    context.message_id = f'msg{random.randint(1, 1000)}'  # Unique message ID
+    context.source_node_id = source_node.id
+    store.message_id = context.message_id
     L2 = source_node.position
+    if trace is not None:
+        trace.begin(message_id=context.message_id, source=source_node.index, topic=topic, engine=engine,
+                    node_count=store.node_count, threshold=context.get_threshold(),
+                    transmission_range=context.transmission_range)
+    if stats is not None:
+        stats.lap("reset")
+
+    try:
+        if engine == "vectorized":
+            context.event_count = vector_engine.flood(store, source_node.index, topic, context.get_threshold(),
+                                                      context.transmission_range, context.scheduler, stats,
+                                                      progress, progress_interval, trace)
+        else:
+            # Mark the source node as transmitted
+            store.transmitted[source_node.index] = True
+            if trace is not None:
+                trace.record(flood_trace.TRANSMIT, current_time, source_node.index)
+            if not topic in source_node.subscribed_topics:
+                # Broadcast message to neighbors that have subscribed
+                first_edge = int(store.offsets[source_node.index])
+                for edge, neighbor in enumerate(source_node.neighbors, start=first_edge):
+                    neighbor.receive_message(topic, context.message_id, L2, source_node, current_time, event_queue, event_id_counter, source_node.position, edge=edge, stats=stats, trace=trace)
+            if stats is not None:
+                stats.lap("initial_broadcast")
+
+            # Process the event queue
+            next_report = progress_interval
+            while event_queue:
+                current_time, _, node, _, message_id = event_queue.pop()
+                if progress is not None and current_time >= next_report:
+                    progress(current_time)
+                    next_report = current_time + progress_interval
+                Node(store, node, context).transmit_message(topic, message_id, source_node.position, event_queue, current_time, event_id_counter, stats=stats, trace=trace)
+            context.event_count = event_queue.popped
+            if stats is not None:
+                stats.lap("event_loop")
+                stats.events_pushed, stats.events_popped = event_queue.pushed, event_queue.popped
+    finally:
+        # Update the context with results (also those of a cancelled flood)
+        collect_results(context)
+    if stats is not None:
+        stats.lap("results")
+        stats.engine, stats.scheduler, stats.node_count = engine, context.scheduler, store.node_count
+        stats.transmissions = len(context.transmitting_nodes)
+
+def collect_results(context):
+    """Fill the context's node lists from the message state of its network."""
+    store = context.network
+    received = store.nearest_tx != np.inf
+    context.transmitting_nodes = (np.flatnonzero(store.transmitted) + 1).tolist()
+    context.non_transmitting_nodes = (np.flatnonzero(received & ~store.transmitted) + 1).tolist()
+    context.not_received_nodes = (np.flatnonzero(~received) + 1).tolist()
+
+def send_messages(messages, context=None):
+    """
+    Flood many messages concurrently on one shared event timeline.
+
+    Unlike `send_new_message`, nothing is reset per message: each message keeps
+    sparse state for the nodes it reaches, and the context's single-message
+    results are left untouched.
 
-    # Mark the source node as transmitted
-    source_node.transmitted.add(Config.message_id)
-    if not topic in source_node.subscribed_topics:
-        # Broadcast message to neighbors that have subscribed
-        for neighbor in source_node.neighbors:
-            neighbor.receive_message(topic, Config.message_id, L2, source_node, current_time, event_queue, event_id_counter, source_node.position)
-
-    # Process the event queue
-    while event_queue:
-        current_time, _, function, *args = heapq.heappop(event_queue)
-        function(*args, event_queue=event_queue, current_time=current_time, event_id_counter=event_id_counter)
-
-    # Update Config with results
-    Config.transmitting_nodes = [node.id for node in Config.nodes.values() if Config.message_id in node.transmitted]
-    Config.non_transmitting_nodes = [node.id for node in Config.nodes.values()
-                                     if Config.message_id in node.distance_to_nearest_tx and Config.message_id not in node.transmitted]
-    Config.not_received_nodes = [node.id for node in Config.nodes.values() if Config.message_id not in node.distance_to_nearest_tx]
-
-def resend_message():
-    send_new_message(current_publisher, current_topic)
\ No newline at end of file
+    Args:
+        messages (iterable): (publisher_id, topic, start_time) tuples. A publisher_id of
+            None picks a random source like `send_new_message`.
+        context (SimulationContext, optional): Simulation to run in. Defaults to Config.
+
+    Returns:
+        list[vector_engine.MessageFlood]: One result per message, in input order, with
+        `transmitting_nodes`, `non_transmitting_nodes` and `not_received_nodes`.
+    """
+    context = Config if context is None else context
+    store = context.network
+    floods = []
+    for number, (publisher_id, topic, start_time) in enumerate(messages, start=1):
+        source_node = select_source(publisher_id, context)
+        floods.append(vector_engine.MessageFlood(f'msg{number}', source_node.index, topic, start_time,
+                                                 store.node_count))
+    return vector_engine.flood_many(store, floods, context.get_threshold(), context.transmission_range,
+                                    context.scheduler)
+
+def resend_message(context=None):
+    context = Config if context is None else context
+    send_new_message(context.current_publisher, context.current_topic, context=context)
@@ -1,99 +1,205 @@
-import math
+import numpy as np
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib import colormaps
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import EllipseCollection
+from matplotlib.colors import Normalize, to_rgba
 from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
-from PyQt5.QtWidgets import QLineEdit, QInputDialog
+from matplotlib.lines import Line2D
+from PyQt5.QtGui import QCursor
+from PyQt5.QtWidgets import QLineEdit, QInputDialog, QToolTip
 from config import Config
+from flood_trace import TraceReader, TraceReplay
+from spatial_grid import SpatialGrid
+
+# Node states, as indices into STATE_COLORS
+TRANSMITTED, RECEIVED, NOT_RECEIVED = range(3)
+STATE_COLORS = np.array([to_rgba(color, 0.4) for color in ("red", "green", "blue")])
+STATE_NAMES = ("Transmitted", "Received Only", "Did Not Receive")
+MAX_LABELS = 200  # Node labels are only drawn when at most this many nodes are in view
+MIN_NODE_PIXELS = 3  # Nodes never shrink below this when zoomed out
+MAX_RANGES = 5_000  # Transmission ranges are only drawn when at most this many are in view
+HIT_PIXELS = 5  # Clicks and hovers this close to a node (in pixels) hit it, however small it is drawn
+ZOOM_STEP = 1.25  # Scroll wheel zoom per step
+
 
 class PlotCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=5, height=5, dpi=100, on_run_send=None):
+    """Draws a network and the state of its last message.
+
+    The artists are built once per topology: all nodes are one collection,
+    the transmission ranges another. A redraw only recolors the nodes and moves
+    the range circles, and is blitted over a cached background (axes, grid,
+    legend), so floods of 50k nodes can be animated. ID and topic labels are
+    only drawn when few nodes are in view; scroll to zoom in on them.
+    Clicks and hovers find the node under the mouse through a `SpatialGrid`
+    of the node positions. A flood trace (see `flood_trace.py`) can be
+    replayed at any time of the flood with `load_trace` and `show_trace_time`.
+    """
+
+    def __init__(self, parent=None, width=5, height=5, dpi=100, on_run_send=None, context=None):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
         super().__init__(self.fig)
         self.setParent(parent)
         self.ax = self.fig.add_subplot(111)
-        self.node_positions = {}  # Map positions to node IDs
         self.mpl_connect("button_press_event", self.on_click)  # Add click event handler
+        self.mpl_connect("motion_notify_event", self.on_hover)
+        self.mpl_connect("scroll_event", self.on_scroll)
+        self.mpl_connect("draw_event", self.on_draw)
         self.on_run_send_callback = on_run_send  # Save the callback reference
+        self.context = Config if context is None else context  # Simulation to draw
 
-    def plot_network(self):
-        """Plots the network simulation result."""
-        self.fig.clear()
-        self.ax = self.fig.add_subplot(111)
-        self.node_positions = {}  # Reset node positions
-
-        # Separate positions for different categories
-        tx_x, tx_y = [], []
-        rx_only_x, rx_only_y = [], []
-        not_rx_x, not_rx_y = [], []
-        tx_node_ids = []
-
-        # Initialize min/max coordinates for dynamic axis scaling
-        all_x, all_y = [], []
-
-        for node in Config.nodes.values():
-            x, y = node.position
-            all_x.append(x)
-            all_y.append(y)
-
-            self.node_positions[(x, y)] = node.id  # Map position to node ID
-
-            if Config.message_id in node.transmitted:
-                tx_x.append(x)
-                tx_y.append(y)
-                tx_node_ids.append(node.id)
-                # Draw transmission range circle
-                circle = plt.Circle((x, y), Config.transmission_range, color='red', fill=False, linestyle='--', alpha=0.1)
-                self.ax.add_artist(circle)
-            elif Config.message_id in node.distance_to_nearest_tx:
-                rx_only_x.append(x)
-                rx_only_y.append(y)
-            else:
-                not_rx_x.append(x)
-                not_rx_y.append(y)
+        self.artists_key = None  # What the current artists were built for
+        self.labels_key = None
+        self.positions = None  # (n, 2) node positions
+        self.node_diameter = self.drawn_diameter = None
+        self.grid = None  # Spatial index of the node indices, for hit-testing
+        self.hovered = None  # Index of the node under the mouse
+        self.nodes = self.ranges = self.source = None
+        self.labels = []
+        self.state = self.transmitted = None  # Node states and transmitted mask of the last plot
+        self.node_colors = None  # (n, 4) RGBA per node
+        self.heatmap = None  # (values, label) of the heatmap on screen
+        self.colorbar = None
+        self.background = None  # Everything but the animated artists, for blitting
+        self.replay = None  # TraceReplay of the loaded trace
 
-            # Annotate node IDs in the center of the node and topics underneath
-            self.ax.text(
-                x, y,  # Centered ID
-                f"{node.id}",
-                color='white',
-                fontsize=7,
-                ha='center',
-                va='center'
-            )
-            topics_label = ",".join(node.subscribed_topics)  # Format topics
-            self.ax.text(
-                x, y - 17,  # Offset the label below the node
-                topics_label,
-                fontsize=5,
-                ha='center',
-                va='top'
-                # bbox=dict(facecolor='white', alpha=0.6, edgecolor='none')
-            )
-
-        # Plot nodes with different colors
-        self.ax.scatter(tx_x, tx_y, c='red', alpha=0.4, label='Transmitted', s=150)
-        self.ax.scatter(rx_only_x, rx_only_y, c='green',alpha=0.4, label='Received Only', s=150)
-        self.ax.scatter(not_rx_x, not_rx_y, c='blue',alpha=0.4, label='Did Not Receive', s=150)
+    def plot_network(self, transmitted=None, received=None, source=None):
+        """Plots the network simulation result.
+
+        `transmitted` and `received` are optional boolean arrays (by node
+        index) to draw instead of the network's message state, e.g. progress
+        snapshots of a flood that is still running in another thread. `source`
+        is the node index to mark as source instead of the context's.
+        """
+        context = self.context
+        store = context.network
+        if store is None:
+            return
+        if self.colorbar is not None:
+            self.artists_key = None  # Back from a heatmap
+        rebuilt = self.build_artists()
+        if transmitted is None:
+            transmitted = store.transmitted
+            received = store.nearest_tx != np.inf
+
+        self.state = np.full(store.node_count, NOT_RECEIVED)
+        self.state[received] = RECEIVED
+        self.state[transmitted] = TRANSMITTED
+        self.transmitted = np.array(transmitted, dtype=bool)
+        self.node_colors = STATE_COLORS[self.state]
 
         # Highlight the source node
-        if Config.source_node_id in tx_node_ids:
-            index = tx_node_ids.index(Config.source_node_id)
-            self.ax.scatter([tx_x[index]], [tx_y[index]], c='black', s=200, label='Source Node')
+        if source is None:
+            source = context.source_node_id - 1 if context.source_node_id else None
+        if source is not None and source < store.node_count and transmitted[source]:
+            self.source.set_offsets(self.positions[[source]])
+        else:
+            self.source.set_offsets(np.zeros((0, 2)))
+
+        self.update_view()
+        labels_changed = self.update_labels()
+        if rebuilt or labels_changed:
+            self.draw()
+        else:
+            self.blit_animated()
+
+    def plot_heatmap(self, values, label=""):
+        """Color every node by a value, e.g. per-source results of `all_sources.flood_all`.
+
+        Nodes with a NaN value are drawn gray. The next `plot_network` call
+        returns to the message state.
+        """
+        store = self.context.network
+        if store is None:
+            return
+        self.artists_key = None  # A fresh figure, so the colorbar can take its space
+        self.build_artists()
+        values = np.asarray(values, dtype=np.float64)
+        known = ~np.isnan(values)
+        norm = Normalize(*(values[known].min(), values[known].max()) if known.any() else (0, 1))
+        cmap = colormaps["viridis"]
+        self.node_colors = cmap(norm(np.where(known, values, 0)))
+        self.node_colors[~known] = to_rgba('lightgray')
+        self.state = None
+        self.transmitted = np.zeros(store.node_count, dtype=bool)
+        self.source.set_offsets(np.zeros((0, 2)))
+        self.heatmap = (values, label)
+
+        self.ax.get_legend().remove()
+        self.colorbar = self.fig.colorbar(ScalarMappable(norm, cmap), ax=self.ax, label=label, fraction=0.046,
+                                          pad=0.04)
+        self.fig.tight_layout(pad=2.0, h_pad=1.0, w_pad=1.0)
+        self.update_view()
+        self.update_labels()
+        self.draw()
+
+    def load_trace(self, path):
+        """Open a trace file of a flood on the network on screen for `show_trace_time`.
+
+        Returns:
+            TraceReader: The opened trace.
+        """
+        reader = TraceReader(path)
+        if reader.node_count != self.context.network.node_count:
+            raise ValueError(f"The trace is of a {reader.node_count}-node network, "
+                             f"not of the {self.context.network.node_count}-node network on screen.")
+        self.replay = TraceReplay(reader)
+        return reader
+
+    def show_trace_time(self, time):
+        """Draw the loaded trace's flood as it was at `time`."""
+        if self.replay is None:
+            return
+        transmitted, received = self.replay.state_at(time)
+        self.plot_network(transmitted, received, source=self.replay.reader.meta.get("source"))
+
+    def build_artists(self):
+        """(Re)build the figure if the network changed since the last plot. Returns whether it did."""
+        context = self.context
+        store = context.network
+        key = (id(store), store.topology_version, context.transmission_range)
+        if key == self.artists_key:
+            return False
+        self.artists_key = key
+        self.labels_key = None
+        self.labels = []
+        self.heatmap = self.colorbar = None
+        self.fig.clear()
+        self.ax = self.fig.add_subplot(111)
+        self.positions = np.column_stack((store.x, store.y))
+        self.grid = self.hovered = None
+
+        # Node and circle sizes are in data units, so they keep their size relative to the network when zooming
+        range_diameter = 2 * context.transmission_range
+        self.ranges = EllipseCollection(range_diameter, range_diameter, 0, units='xy', offsets=np.zeros((0, 2)),
+                                        offset_transform=self.ax.transData, facecolors='none', edgecolors='red',
+                                        linestyles='--', alpha=0.1, animated=True)
+        self.node_diameter = node_diameter = 0.3 * context.transmission_range
+        self.nodes = EllipseCollection(node_diameter, node_diameter, 0, units='xy', offsets=self.positions,
+                                       offset_transform=self.ax.transData, edgecolors='none', animated=True)
+        source_diameter = 0.35 * context.transmission_range
+        self.source = EllipseCollection(source_diameter, source_diameter, 0, units='xy', offsets=np.zeros((0, 2)),
+                                        offset_transform=self.ax.transData, facecolors='black', animated=True)
+        for collection in (self.ranges, self.nodes, self.source):
+            self.ax.add_collection(collection)
 
         # Set dynamic axis limits to fit all nodes with inner margins
         padding = 5  # Padding around the plot
-        inner_margin = Config.transmission_range / 2 + 10  # Additional inner margin
-        x_min, x_max = min(all_x) - padding - inner_margin, max(all_x) + padding + inner_margin
-        y_min, y_max = min(all_y) - padding - inner_margin, max(all_y) + padding + inner_margin
-        self.ax.set_xlim(x_min, x_max)
-        self.ax.set_ylim(y_min, y_max)
+        inner_margin = context.transmission_range / 2 + 10  # Additional inner margin
+        margin = padding + inner_margin
+        self.ax.set_xlim(store.x.min() - margin, store.x.max() + margin)
+        self.ax.set_ylim(store.y.min() - margin, store.y.max() + margin)
 
         # Set aspect ratio to 'equal' to make the plot square
         self.ax.set_aspect('equal', adjustable='box')
         self.ax.grid(True)
 
         # Place the legend outside the plot
+        handles = [Line2D([], [], marker='o', linestyle='', markersize=12, markeredgewidth=0, color=color, label=label)
+                   for color, label in zip(STATE_COLORS, STATE_NAMES)]
+        handles.append(Line2D([], [], marker='o', linestyle='', markersize=14, color='black', label='Source Node'))
         self.ax.legend(
+            handles=handles,
             loc='upper center',
             bbox_to_anchor=(0.5, -0.15),  # Move the legend below the plot
             ncol=2,  # Arrange legend items in two columns
@@ -102,27 +208,150 @@ class PlotCanvas(FigureCanvas):
 
         # Use tight_layout to minimize white space
         self.fig.tight_layout(pad=2.0, h_pad=1.0, w_pad=1.0)
-        self.draw()
+        return True
+
+    def update_labels(self):
+        """Label the nodes in view if there are few enough of them. Returns whether the labels changed."""
+        store = self.context.network
+        in_view = np.flatnonzero(self.in_view())
+        if len(in_view) > MAX_LABELS:
+            in_view = in_view[:0]
+        key = (in_view.tobytes(), store.subscription_version)
+        if key == self.labels_key:
+            return False
+        self.labels_key = key
+
+        for label in self.labels:
+            label.remove()
+        self.labels = []
+        for index in in_view.tolist():
+            x, y = self.positions[index]
+            # Annotate node IDs in the center of the node and topics underneath
+            self.labels.append(self.ax.text(x, y, f"{index + 1}", color='white', fontsize=7, ha='center', va='center',
+                                            animated=True))
+            # Topics sit below the node, so they are drawn with the background
+            topics_label = ",".join(store.topics_of(index))  # Format topics
+            self.labels.append(self.ax.text(x, y - 17, topics_label, fontsize=5, ha='center', va='top'))
+        return True
+
+    def in_view(self, margin=0):
+        """Return a boolean array of the nodes within `margin` of the visible area."""
+        (x_min, x_max), (y_min, y_max) = self.ax.get_xlim(), self.ax.get_ylim()
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        return (x >= x_min - margin) & (x <= x_max + margin) & (y >= y_min - margin) & (y <= y_max + margin)
+
+    def update_view(self):
+        """Hand the nodes and range circles in view to their collections.
+
+        Range circles are skipped when more than `MAX_RANGES` would be drawn:
+        that many overlapping faint circles only tint the whole view, and they
+        would cost more to draw than the nodes themselves.
+        """
+        if self.node_colors is None:
+            return
+        x_min, x_max = self.ax.get_xlim()
+        diameter = max(self.node_diameter, MIN_NODE_PIXELS * (x_max - x_min) / self.ax.bbox.width)
+        self.drawn_diameter = diameter
+        self.nodes.set_widths(diameter)
+        self.nodes.set_heights(diameter)
+        in_view = self.in_view(self.context.transmission_range / 2)
+        self.nodes.set_offsets(self.positions[in_view])
+        self.nodes.set_facecolors(self.node_colors[in_view])
+        ranges = self.transmitted & self.in_view(self.context.transmission_range)
+        if np.count_nonzero(ranges) > MAX_RANGES:
+            ranges = np.zeros_like(ranges)
+        self.ranges.set_offsets(self.positions[ranges])
+
+    def animated_artists(self):
+        return [self.ranges, self.nodes, self.source] + [label for label in self.labels if label.get_animated()]
+
+    def on_draw(self, event):
+        """Cache the freshly drawn background and draw the animated artists over it."""
+        if self.nodes is None:
+            return
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        for artist in self.animated_artists():
+            self.ax.draw_artist(artist)
+
+    def blit_animated(self):
+        """Redraw only the animated artists over the cached background."""
+        if self.background is None:
+            self.draw()
+            return
+        self.restore_region(self.background)
+        for artist in self.animated_artists():
+            self.ax.draw_artist(artist)
+        self.blit(self.fig.bbox)
+
+    def on_scroll(self, event):
+        """Zoom in or out around the mouse position."""
+        if event.inaxes != self.ax or self.nodes is None:
+            return
+        scale = 1 / ZOOM_STEP if event.button == 'up' else ZOOM_STEP
+        x_min, x_max = self.ax.get_xlim()
+        y_min, y_max = self.ax.get_ylim()
+        self.ax.set_xlim(event.xdata - (event.xdata - x_min) * scale, event.xdata + (x_max - event.xdata) * scale)
+        self.ax.set_ylim(event.ydata - (event.ydata - y_min) * scale, event.ydata + (y_max - event.ydata) * scale)
+        self.update_view()
+        self.update_labels()
+        self.draw_idle()
+
+    def node_grid(self):
+        """Return the spatial index of the plotted nodes, building it on first use."""
+        if self.grid is None:
+            self.grid = SpatialGrid(self.context.transmission_range)
+            for index, position in enumerate(self.positions.tolist()):
+                self.grid.insert(index, position)
+        return self.grid
+
+    def node_at(self, x, y):
+        """Return the index of the node drawn at a point, or None."""
+        if self.positions is None or x is None:
+            return None
+        x_min, x_max = self.ax.get_xlim()
+        radius = max(self.drawn_diameter / 2, HIT_PIXELS * (x_max - x_min) / self.ax.bbox.width)
+        candidates = np.array(self.node_grid().within((x, y), radius), dtype=np.int64)
+        if not candidates.size:
+            return None
+        distances = np.hypot(self.positions[candidates, 0] - x, self.positions[candidates, 1] - y)
+        closest = np.argmin(distances)  # Candidates are sorted, so the lowest ID wins among nodes at one spot
+        return int(candidates[closest]) if distances[closest] <= radius else None
+
+    def describe_node(self, index):
+        """Return the tooltip text of a node: its ID, topics and state in the last plot."""
+        context = self.context
+        topics = ",".join(context.network.topics_of(index)) or "none"
+        lines = [f"Node {index + 1}", f"Topics: {topics}"]
+        if self.heatmap is not None:
+            values, label = self.heatmap
+            lines.append(f"{label}: {values[index]:.4g}")
+        elif self.state is not None:
+            state = STATE_NAMES[self.state[index]]
+            if index + 1 == context.source_node_id and self.transmitted[index]:
+                state += " (source)"
+            lines.append(f"State: {state}")
+        return "\n".join(lines)
 
     def on_click(self, event):
         """Handle click events to edit node topics."""
         if event.inaxes != self.ax:
             return
 
-        # Find the closest node to the click position
-        clicked_x, clicked_y = event.xdata, event.ydata
-        closest_node = None
-        closest_distance = float('inf')
-
-        for (x, y), node_id in self.node_positions.items():
-            dist = math.sqrt((clicked_x - x) ** 2 + (clicked_y - y) ** 2)
-            if dist < closest_distance:
-                closest_distance = dist
-                closest_node = Config.nodes[node_id]
-
         # If a node was clicked, show a dialog to edit topics
-        if closest_node and closest_distance <= 10:  # Allow a small tolerance for clicks
-            self.edit_node_topics(closest_node)
+        index = self.node_at(event.xdata, event.ydata)
+        if index is not None:
+            self.edit_node_topics(self.context.nodes[index + 1])
+
+    def on_hover(self, event):
+        """Show a tooltip for the node under the mouse."""
+        index = self.node_at(event.xdata, event.ydata) if event.inaxes == self.ax else None
+        if index == self.hovered:
+            return
+        self.hovered = index
+        if index is None:
+            QToolTip.hideText()
+        else:
+            QToolTip.showText(QCursor.pos(), self.describe_node(index), self)
 
     def edit_node_topics(self, node):
         """Open a dialog to edit a node's subscribed topics."""
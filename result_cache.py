@@ -0,0 +1,151 @@
+"""LRU cache of finished floods.
+
+The GUI and sweeps run a plain OFP flood before every topic flood, only to
+compare transmission counts, so re-sending or switching topics on an
+unchanged network repeats the same baseline flood. `send_message` is
+`send_new_message` backed by a `ResultCache`: a flood that was already run
+on the same network state, threshold, range, publisher and topic is
+restored into the network instead of being run again.
+
+The key holds the store's `topology_version`, so moved nodes or links never
+return a stale result. Topic edits are tracked per entry instead: a topic
+flood only depends on subscriptions through the forwarding decisions of
+the nodes it reached (and whether the source is subscribed), so after an
+edit an entry is still used if none of those decisions changed, e.g. when
+the edited node and its neighbors were not reached. Call `invalidate` after
+a setup to free the entries of the old network. All engines and schedulers
+produce identical floods, so they share entries.
+
+Usage:
+    cache = ResultCache()
+    publisher = result_cache.send_message(cache, None, None, context)  # Draws the publisher
+    result_cache.send_message(cache, publisher, "H", context)
+"""
+import weakref
+from collections import OrderedDict
+import numpy as np
+from config import Config
+import ofp_simulation
+
+
+class FloodResult:
+    """Sparse copy of a finished flood: what it reached, at which distance, and what it transmitted."""
+    __slots__ = ("store", "topic", "message_id", "source", "reached", "nearest_tx", "transmitted", "event_count",
+                 "subscription_version", "forwards", "source_subscribed")
+
+    def __init__(self, context, topic=None):
+        store = context.network
+        self.store = weakref.ref(store)  # Ids of freed stores are reused, so keys alone are not enough
+        self.topic = topic
+        self.message_id = context.message_id
+        self.source = context.source_node_id
+        self.reached = np.flatnonzero(store.nearest_tx != np.inf)
+        self.nearest_tx = store.nearest_tx[self.reached]
+        self.transmitted = np.flatnonzero(store.transmitted)
+        self.event_count = context.event_count
+        self.subscription_version = store.subscription_version
+        self.forwards, self.source_subscribed = self.decisions(store)
+
+    def decisions(self, store):
+        """Return what the flood depends on from subscriptions.
+
+        That is the forwarding decision of every node it reached and whether
+        the source is subscribed; nodes it never reached never decided anything.
+        """
+        if self.topic is None:
+            return None, False
+        columns = store.topic_columns(self.topic)
+        source_subscribed = columns is not None and bool(columns[0][self.source - 1] & columns[2])
+        return store.forwards(self.topic, self.reached), source_subscribed
+
+    def is_current(self, store):
+        """Return whether the flood would still come out the same on the store's subscriptions."""
+        if self.subscription_version != store.subscription_version:
+            forwards, source_subscribed = self.decisions(store)
+            if source_subscribed != self.source_subscribed or not np.array_equal(forwards, self.forwards):
+                return False
+            self.subscription_version = store.subscription_version
+        return True
+
+    def restore(self, context):
+        """Put the flood back into the context's network and results."""
+        store = context.network
+        store.clear_message_state()
+        store.message_id = context.message_id = self.message_id
+        store.nearest_tx[self.reached] = self.nearest_tx
+        store.transmitted[self.transmitted] = True
+        context.source_node_id = self.source
+        context.event_count = self.event_count
+        ofp_simulation.collect_results(context)
+
+
+class ResultCache:
+    """Least recently used cache of `FloodResult`s, holding at most `max_entries`."""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(context, publisher_id, topic):
+        """Return the cache key of a flood: everything its result depends on."""
+        store = context.network
+        return (id(store), store.topology_version, context.get_threshold(), context.transmission_range,
+                publisher_id, topic)
+
+    def get(self, context, publisher_id, topic):
+        """Return the cached result of a flood, or None."""
+        key = self.key(context, publisher_id, topic)
+        result = self.entries.get(key)
+        if result is not None and (result.store() is not context.network or not result.is_current(context.network)):
+            del self.entries[key]
+            result = None
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, context, publisher_id, topic):
+        """Cache the flood the context just ran."""
+        self.entries[self.key(context, publisher_id, topic)] = FloodResult(context, topic)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, store=None):
+        """Drop the entries of a store (or all of them)."""
+        for key in list(self.entries):
+            if store is None or key[0] == id(store):
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def send_message(cache, publisher_id=None, topic=None, context=None, **kwargs):
+    """Send a message like `send_new_message`, reusing a cached result of the same flood.
+
+    A publisher of None is drawn at random first (a random pick is part of
+    no cache key), and the drawn ID is returned so related floods can reuse
+    it. `kwargs` go to `send_new_message`; they have no effect on a hit, and
+    a cancelled flood is not cached. A flood with a `trace` always runs,
+    since the trace needs its events, and replaces the cached result.
+
+    Returns:
+        int: The publisher's node ID.
+    """
+    context = Config if context is None else context
+    if publisher_id is None:
+        publisher_id = ofp_simulation.select_source(None, context).id
+    context.current_publisher = publisher_id
+    context.current_topic = topic
+    result = cache.get(context, publisher_id, topic) if kwargs.get("trace") is None else None
+    if result is not None:
+        result.restore(context)
+    else:
+        ofp_simulation.send_new_message(publisher_id, topic, context=context, **kwargs)
+        cache.put(context, publisher_id, topic)
+    return publisher_id
@@ -0,0 +1,190 @@
+"""Persistent cache of sweep results, shared by sessions and worker processes.
+
+Sweeps run the same (parameters, seed, topic, publisher) points again and
+again between sessions. A `RunCache` keeps the result row of every finished
+run in an SQLite file, with the nodes its message reached, so a re-run
+sweep only computes the points that changed.
+
+Keys are content hashes of everything a run depends on: every simulation
+parameter except the engine settings (all engines produce identical
+floods), the seed, topic and publisher, the contents of the snapshot it
+loads, and `ofp_simulation.ENGINE_VERSION`. A changed parameter or
+snapshot, or a new engine version, can never return an old row.
+
+The file is bounded to `max_bytes` of stored results, dropping the least
+recently used runs first. It is opened in WAL mode, so pool workers can
+write their rows while the sweep reads others.
+
+Usage:
+    cache = RunCache("runs/cache.sqlite")
+    key = run_key(context, seed=7, topic="H")
+    row = cache.get(key)  # None on a miss
+    cache.put(key, row, context)  # After running it
+"""
+import functools
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+import numpy as np
+from config import SimulationContext
+import ofp_simulation
+import snapshot
+
+MAX_BYTES = 1 << 30  # Default size bound of the stored results
+# Parameters that choose how a flood is computed, not what it computes
+ENGINE_PARAMETERS = ("engine", "scheduler")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    row TEXT NOT NULL,
+    transmitting BLOB NOT NULL,
+    non_transmitting BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_used ON runs (used);
+CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO usage VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS runs_insert AFTER INSERT ON runs
+    BEGIN UPDATE usage SET bytes = bytes + NEW.size; END;
+CREATE TRIGGER IF NOT EXISTS runs_update AFTER UPDATE OF size ON runs
+    BEGIN UPDATE usage SET bytes = bytes + NEW.size - OLD.size; END;
+CREATE TRIGGER IF NOT EXISTS runs_delete AFTER DELETE ON runs
+    BEGIN UPDATE usage SET bytes = bytes - OLD.size; END;
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def snapshot_digest(path):
+    """Content digest of a snapshot, computed once per process."""
+    return snapshot.digest(path)
+
+
+def run_key(context, seed, topic, publisher=None, snapshot_path=None):
+    """Return the cache key of a run.
+
+    Args:
+        context (SimulationContext): Context with the run's parameters (its network is not used).
+        seed (int): Seed of the run's network and random picks.
+        topic (str): Topic of the run (None for plain OFP).
+        publisher (int, optional): Publisher ID; None means drawn from the seed.
+        snapshot_path (str, optional): Snapshot the run loads instead of generating its network.
+    """
+    content = {
+        "parameters": {name: getattr(context, name) for name in SimulationContext.PARAMETERS
+                       if name not in ENGINE_PARAMETERS},
+        "seed": seed,
+        "topic": topic,
+        "publisher": publisher,
+        "snapshot": snapshot_digest(snapshot_path) if snapshot_path else None,
+        "engine_version": ofp_simulation.ENGINE_VERSION,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def pack(node_ids):
+    return zlib.compress(np.asarray(node_ids, dtype=np.int32).tobytes())
+
+
+def unpack(data):
+    return np.frombuffer(zlib.decompress(data), dtype=np.int32).tolist()
+
+
+class RunCache:
+    """Result rows of finished runs in an SQLite file, with LRU eviction past `max_bytes`.
+
+    Every process opens its own `RunCache` on the same path; instances are
+    not shared between processes or threads.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+        self.hits = 0
+        self.misses = 0
+
+    def transaction(self):
+        """Context manager for a write transaction (taken at once, so writers queue instead of deadlocking)."""
+        return Transaction(self.connection)
+
+    def get(self, key):
+        """Return the cached row of a run, or None."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Return {key: row} for the runs among `keys` that are cached, marking them used."""
+        rows = {}
+        keys = list(keys)
+        now = time.time()
+        with self.transaction():
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, row in self.connection.execute(f"SELECT key, row FROM runs WHERE key IN ({marks})", chunk):
+                    rows[key] = json.loads(row)
+                self.connection.execute(f"UPDATE runs SET used = ? WHERE key IN ({marks})", [now] + chunk)
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return rows
+
+    def nodes(self, key):
+        """Return (transmitting, non_transmitting) node IDs of a cached run, or None."""
+        found = self.connection.execute("SELECT transmitting, non_transmitting FROM runs WHERE key = ?",
+                                        (key,)).fetchone()
+        return None if found is None else (unpack(found[0]), unpack(found[1]))
+
+    def put(self, key, row, context):
+        """Cache the row of a run and the result node lists `context` holds for it."""
+        data = json.dumps(row)
+        transmitting, non_transmitting = pack(context.transmitting_nodes), pack(context.non_transmitting_nodes)
+        size = len(data) + len(transmitting) + len(non_transmitting)
+        with self.transaction():
+            self.connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET row = excluded.row, "
+                "transmitting = excluded.transmitting, non_transmitting = excluded.non_transmitting, "
+                "size = excluded.size, used = excluded.used",
+                (key, data, transmitting, non_transmitting, size, time.time()))
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used runs until the stored results fit in `max_bytes`."""
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for key, size in self.connection.execute("SELECT key, size FROM runs ORDER BY used"):
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+        self.connection.executemany("DELETE FROM runs WHERE key = ?", doomed)
+
+    def size(self):
+        """Bytes of stored results."""
+        return self.connection.execute("SELECT bytes FROM usage").fetchone()[0]
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class Transaction:
+    """`BEGIN IMMEDIATE` ... `COMMIT` (or `ROLLBACK` on an exception) on an autocommit connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, kind, value, traceback):
+        self.connection.execute("COMMIT" if kind is None else "ROLLBACK")
@@ -0,0 +1,93 @@
+"""Save and load complete network topologies.
+
+A snapshot is a directory holding one `.npy` file per topology array of the
+`NetworkStore` (positions, CSR adjacency, subscriptions and their bitsets)
+and a `meta.json` with the topic names, `strategicLast` and the parameters
+the network was generated with. Loading memory-maps the arrays, so even a
+1M-node snapshot opens almost instantly, and worker processes that load the
+same snapshot share its pages instead of copying them. The maps are
+copy-on-write: editing a loaded network (e.g. a node's topics) only changes
+the private copy of the process that does it, never the files.
+
+Usage:
+    snapshot.save("runs/net-7", context)
+    snapshot.load("runs/net-7", other_context)
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from config import Config
+from network_store import TOPOLOGY_ARRAYS, NetworkStore, NodeMap
+from ofp_simulation import Node
+
+FORMAT_VERSION = 1
+# Parameters that determine the generated network (the rest only affect floods)
+TOPOLOGY_PARAMETERS = ("node_count", "area_width", "transmission_range", "is_random", "topics",
+                       "placement", "placement_options")
+
+
+def save(path, context=None):
+    """Write the network of a context to the snapshot directory `path`."""
+    context = Config if context is None else context
+    store = context.network
+    os.makedirs(path, exist_ok=True)
+    for name in TOPOLOGY_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(store, name)))
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "topic_names": store.topic_names,
+        "strategicLast": context.strategicLast,
+        "seed": context.seed,
+        "parameters": {name: getattr(context, name) for name in TOPOLOGY_PARAMETERS},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_meta(path):
+    """Return the metadata of a snapshot without opening its arrays."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {meta.get('format_version')!r} in {path}")
+    return meta
+
+
+def digest(path):
+    """Return a hex digest of a snapshot's contents (metadata and arrays), wherever it is stored."""
+    content = hashlib.sha256()
+    for name in ("meta",) + TOPOLOGY_ARRAYS:
+        with open(os.path.join(path, "meta.json" if name == "meta" else f"{name}.npy"), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                content.update(chunk)
+    return content.hexdigest()
+
+
+def load(path, context=None, mmap=True):
+    """Load a snapshot into a context, replacing its network and generating parameters.
+
+    Args:
+        path (str): Snapshot directory written by `save`.
+        context (SimulationContext, optional): Context to load into. Defaults to Config.
+        mmap (bool): Memory-map the arrays (copy-on-write). False reads them into memory.
+
+    Returns:
+        NetworkStore: The loaded network, also set as `context.network`.
+    """
+    context = Config if context is None else context
+    meta = read_meta(path)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="c" if mmap else None)
+              for name in TOPOLOGY_ARRAYS}
+    store = NetworkStore.restore(arrays, meta["topic_names"])
+
+    for name, value in meta["parameters"].items():
+        setattr(context, name, value)
+    context.set_area(context.area_width)
+    context.strategicLast = meta["strategicLast"]
+    context.transmitting_nodes = []
+    context.non_transmitting_nodes = []
+    context.not_received_nodes = []
+    context.network = store
+    context.nodes = NodeMap(store, Node, context)
+    return store
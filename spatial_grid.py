@@ -0,0 +1,51 @@
+import math
+
+
+class SpatialGrid:
+    """Uniform grid that buckets items by position for fast range queries.
+
+    Any two points closer than `cell_size` always land in the same or adjacent
+    cells, so a range query with radius <= `cell_size` only has to look at the
+    3x3 block of cells around the query point.
+    """
+
+    def __init__(self, cell_size):
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive.")
+        # Widen the cells a hair so rounding in the division can never push a
+        # point that is exactly `cell_size` away two cells over.
+        self.cell_size = cell_size * (1 + 1e-9)
+        self.cells = {}
+
+    def cell_of(self, position):
+        """Return the (column, row) cell containing a position."""
+        return (math.floor(position[0] / self.cell_size),
+                math.floor(position[1] / self.cell_size))
+
+    def insert(self, item, position):
+        """Add an item at the given position."""
+        self.cells.setdefault(self.cell_of(position), []).append(item)
+
+    def nearby(self, position):
+        """Return the items in the 3x3 block of cells around a position, sorted."""
+        cx, cy = self.cell_of(position)
+        items = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                items.extend(self.cells.get((cx + dx, cy + dy), ()))
+        items.sort()
+        return items
+
+    def within(self, position, radius):
+        """Return the items in all cells touched by a square of half-width `radius` around a position, sorted.
+
+        Unlike `nearby`, the radius may exceed the cell size.
+        """
+        first_x, first_y = self.cell_of((position[0] - radius, position[1] - radius))
+        last_x, last_y = self.cell_of((position[0] + radius, position[1] + radius))
+        items = []
+        for cx in range(first_x, last_x + 1):
+            for cy in range(first_y, last_y + 1):
+                items.extend(self.cells.get((cx, cy), ()))
+        items.sort()
+        return items
@@ -0,0 +1,273 @@
+"""Headless parameter sweeps over a process pool.
+
+A sweep spec is a dict (or JSON file) such as::
+
+    {
+        "grid": {"threshold_ratio": [0.3, 0.4, 0.5], "node_count": [50, 100]},
+        "seeds": 100,
+        "topics": [null, "H"]
+    }
+
+`grid` is expanded as a Cartesian product; alternatively `configs` gives an
+explicit list of parameter dicts. Every config is run once per seed (an int
+means `range(seeds)`) and per topic. Parameters not mentioned keep their
+`Config` defaults. `threshold_ratio` is given as in the GUI, so `epsilon` is
+subtracted the same way `OFPSimulationApp.on_run_setup` does.
+
+With `"snapshot": "path/to/snapshot"` every run loads that saved network
+(see `snapshot.py`) instead of generating one; its pages are shared by all
+workers. Topology parameters then come from the snapshot and cannot be swept.
+
+Runs that differ only in the topic share their network and OFP baseline
+flood (see `result_cache.py`) when they land in the same batch.
+
+With `--cache FILE`, finished runs are kept in a persistent `RunCache` (see
+`run_cache.py`): runs already in it are written straight from the cache,
+and only the others go to the workers, which add their rows as they finish.
+
+Usage:
+    python sweep.py spec.json results.csv [--workers N] [--cache runs/cache.sqlite]
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import Config, SimulationContext
+import ofp_simulation
+from metrics import compute_metrics
+import result_cache
+from result_cache import ResultCache
+import run_cache
+from run_cache import RunCache
+import snapshot
+
+PARAMETERS = ("threshold_ratio", "node_count", "transmission_range", "area_width", "is_random")
+METRICS = ("received", "not_received", "delivery_ratio", "transmitted", "transmission_ratio",
+           "saved_transmissions", "ofp_transmitted", "ofp_transmission_ratio", "pubsub_saved_transmissions")
+FIELDS = PARAMETERS + ("seed", "topic", "publisher") + METRICS
+
+
+def expand_sweep(spec):
+    """Yield one run dict (parameters, seed, topic, publisher) per point of the sweep."""
+    if "configs" in spec:
+        configs = spec["configs"]
+    else:
+        grid = spec.get("grid", {})
+        names = list(grid)
+        configs = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+    seeds = spec.get("seeds", 1)
+    seeds = range(seeds) if isinstance(seeds, int) else seeds
+    topics = spec.get("topics", [None])
+    snapshot_path = spec.get("snapshot")
+    defaults = {name: getattr(Config, name) for name in PARAMETERS}
+    if snapshot_path:
+        defaults.update((name, value) for name, value in snapshot.read_meta(snapshot_path)["parameters"].items()
+                        if name in defaults)
+
+    for config in configs:
+        unknown = set(config) - set(PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+        fixed = set(config) & set(snapshot.TOPOLOGY_PARAMETERS) if snapshot_path else ()
+        if fixed:
+            raise ValueError(f"Parameters fixed by the snapshot cannot be swept: {', '.join(sorted(fixed))}")
+        params = {name: config.get(name, defaults[name]) for name in PARAMETERS}
+        for seed in seeds:
+            for topic in topics:
+                yield dict(params, seed=seed, topic=topic, publisher=spec.get("publisher"), snapshot=snapshot_path)
+
+
+def network_key(run):
+    """Return what the network, publisher and OFP baseline of a run depend on: everything but the topic."""
+    return tuple((name, value) for name, value in sorted(run.items()) if name != "topic")
+
+
+def make_context(run):
+    """Return a context with the parameters of a run, without a network."""
+    return SimulationContext(
+        seed=run["seed"],
+        threshold_ratio=run["threshold_ratio"] - Config.epsilon,
+        node_count=int(run["node_count"]),
+        transmission_range=run["transmission_range"],
+        area_width=run["area_width"],
+        is_random=bool(run["is_random"]),
+    )
+
+
+def run_key(run):
+    """Return the `RunCache` key of a run."""
+    return run_cache.run_key(make_context(run), run["seed"], run["topic"], run["publisher"], run.get("snapshot"))
+
+
+def setup_run(run):
+    """Set up (or load) the network of a run and resolve its publisher; returns (context, publisher)."""
+    context = make_context(run)
+    if run.get("snapshot"):
+        snapshot.load(run["snapshot"], context)
+    else:
+        ofp_simulation.setup_network(context)
+    # A random publisher is drawn once, so the baseline and topic floods start at the same node
+    publisher = run["publisher"] or ofp_simulation.select_source(None, context).id
+    return context, publisher
+
+
+def run_single(run, network=None, cache=None):
+    """Send one message for a single run; return the result row.
+
+    Args:
+        run (dict): Run from `expand_sweep`.
+        network (tuple, optional): `setup_run` result to reuse, from a run with the same `network_key`.
+        cache (ResultCache, optional): Floods already run on that network.
+    """
+    context, publisher = setup_run(run) if network is None else network
+    cache = ResultCache() if cache is None else cache
+
+    # Background OFP run for the pub-sub comparison, as in the GUI
+    result_cache.send_message(cache, publisher, None, context)
+    ofp_transmissions = len(context.transmitting_nodes)
+    if run["topic"]:
+        result_cache.send_message(cache, publisher, run["topic"], context)
+
+    row = {name: run[name] for name in PARAMETERS + ("seed", "topic")}
+    row["publisher"] = context.source_node_id
+    row.update(compute_metrics(run["topic"], ofp_transmissions, context))
+    return row
+
+
+def run_batch(runs, cache_path=None, cache_bytes=run_cache.MAX_BYTES):
+    """Run several runs in one worker call to amortize inter-process overhead.
+
+    Consecutive runs that differ only in the topic (as `expand_sweep` yields
+    them) share one network, publisher and OFP baseline. With `cache_path`,
+    every row is added to that `RunCache` as soon as it is done.
+    """
+    rows = []
+    cache = ResultCache()
+    runs_cache = RunCache(cache_path, cache_bytes) if cache_path else None
+    key = network = None
+    try:
+        for run in runs:
+            if network_key(run) != key:
+                key, network = network_key(run), setup_run(run)
+                cache.invalidate()
+            rows.append(run_single(run, network, cache))
+            if runs_cache is not None:
+                runs_cache.put(run_key(run), rows[-1], network[0])
+    finally:
+        if runs_cache is not None:
+            runs_cache.close()
+    return rows
+
+
+class CsvSink:
+    """Append result rows to a CSV file."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """Append result rows to a Parquet file, one row group per batch (needs pyarrow)."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing Parquet requires pyarrow: pip install pyarrow") from e
+        self.pa = pa
+        self.schema = pa.schema([
+            (name, pa.bool_() if name == "is_random" else pa.string() if name == "topic"
+             else pa.int64() if name in ("node_count", "seed", "publisher", "received", "not_received",
+                                         "transmitted", "ofp_transmitted")
+             else pa.float64())
+            for name in FIELDS
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = {name: [row[name] for row in rows] for name in FIELDS}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_sink(path):
+    """Pick the output format from the file extension."""
+    return ParquetSink(path) if path.endswith(".parquet") else CsvSink(path)
+
+
+def run_sweep(spec, output, workers=None, batch_size=20, cache=None, cache_bytes=run_cache.MAX_BYTES):
+    """Run a sweep on a process pool, streaming rows to `output` as batches finish.
+
+    Args:
+        spec (dict): Sweep specification (see module docstring).
+        output (str): Path of the CSV or Parquet file to write.
+        workers (int, optional): Worker processes. Defaults to every core.
+        batch_size (int): Runs sent to a worker per task.
+        cache (str, optional): `RunCache` file to take finished runs from and add new ones to.
+        cache_bytes (int): Size bound of that cache.
+
+    Returns:
+        int: Number of rows written.
+    """
+    runs = list(expand_sweep(spec))
+    sink = open_sink(output)
+    written = 0
+    try:
+        if cache:
+            runs_cache = RunCache(cache, cache_bytes)
+            try:
+                keys = [run_key(run) for run in runs]
+                cached = runs_cache.get_many(keys)
+            finally:
+                runs_cache.close()
+            if cached:
+                sink.write([cached[key] for key in keys if key in cached])
+                written += len(cached)
+            runs = [run for run, key in zip(runs, keys) if key not in cached]
+        batches = [runs[i:i + batch_size] for i in range(0, len(runs), batch_size)]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(run_batch, batch, cache, cache_bytes) for batch in batches]
+            for future in as_completed(futures):
+                rows = future.result()
+                sink.write(rows)
+                written += len(rows)
+    finally:
+        sink.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an OFP parameter sweep on all cores.")
+    parser.add_argument("spec", help="JSON sweep specification")
+    parser.add_argument("output", help="Output file (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=20, help="Runs per worker task")
+    parser.add_argument("--cache", metavar="FILE", help="Persistent result cache (SQLite) to reuse finished runs from")
+    parser.add_argument("--cache-size", type=int, default=run_cache.MAX_BYTES >> 20,
+                        help="Size bound of the cache in MiB (least recently used runs go first)")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    written = run_sweep(spec, args.output, workers=args.workers, batch_size=args.batch_size, cache=args.cache,
+                        cache_bytes=args.cache_size << 20)
+    print(f"Wrote {written} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""The engines, schedulers and concurrent floods make exactly the same decisions."""
+import numpy as np
+import pytest
+import ofp_simulation
+from config import SimulationContext
+from flood_stats import FloodStats
+
+SEEDS = (0, 1, 2)
+RATIOS = (0.2, 0.4, 0.6)
+TOPICS = (None, "H", "L")
+
+
+def make_context(seed, is_random, threshold_ratio, **params):
+    context = SimulationContext(seed=seed, node_count=150, area_width=800, is_random=is_random,
+                                threshold_ratio=threshold_ratio, **params)
+    ofp_simulation.setup_network(context)
+    return context
+
+
+def flood(context, publisher, topic, **kwargs):
+    """Run one flood and return everything it decided, with its counters."""
+    stats = FloodStats()
+    ofp_simulation.send_new_message(publisher, topic, context=context, stats=stats, **kwargs)
+    counters = {name: getattr(stats, name) for name in FloodStats.COUNTERS}
+    return (context.transmitting_nodes, context.non_transmitting_nodes, context.not_received_nodes,
+            context.network.nearest_tx.tolist(), context.event_count, counters)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("is_random", (False, True))
+@pytest.mark.parametrize("threshold_ratio", RATIOS)
+@pytest.mark.parametrize("topic", TOPICS)
+def test_vectorized_matches_reference(seed, is_random, threshold_ratio, topic):
+    context = make_context(seed, is_random, threshold_ratio)
+    publisher = ofp_simulation.select_source(None, context).id
+    assert flood(context, publisher, topic, engine="vectorized") == flood(context, publisher, topic,
+                                                                           engine="reference")
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("engine", ("vectorized", "reference"))
+@pytest.mark.parametrize("topic", TOPICS)
+def test_calendar_queue_matches_heap(seed, engine, topic):
+    context = make_context(seed, True, 0.4)
+    publisher = ofp_simulation.select_source(None, context).id
+    heap = flood(context, publisher, topic, engine=engine)
+    context.scheduler = "calendar"
+    assert flood(context, publisher, topic, engine=engine) == heap
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("scheduler", ("heap", "calendar"))
+def test_send_messages_matches_single_floods(seed, scheduler):
+    context = make_context(seed, seed % 2 == 1, 0.4, scheduler=scheduler)
+    messages = [(publisher, topic, start_time)
+                for publisher, topic, start_time in zip((3, 17, 42, 3, 99), TOPICS + (None, "E"),
+                                                        (0.0, 0.0, 0.01, 0.5, 0.02))]
+    floods = ofp_simulation.send_messages(messages, context=context)
+    for (publisher, topic, _), result in zip(messages, floods):
+        ofp_simulation.send_new_message(publisher, topic, context=context)
+        assert result.transmitting_nodes == context.transmitting_nodes
+        assert result.non_transmitting_nodes == context.non_transmitting_nodes
+        assert result.not_received_nodes == context.not_received_nodes
+        reached = np.flatnonzero(context.network.nearest_tx != np.inf)
+        assert {index: context.network.nearest_tx[index] for index in reached.tolist()} == result.nearest_tx
+
+
+def test_floods_reach_beyond_the_source():
+    """The comparisons above are only worth something if the floods spread."""
+    context = make_context(0, False, 0.4)
+    ofp_simulation.send_new_message(1, None, context=context)
+    assert len(context.transmitting_nodes) > 10
@@ -0,0 +1,79 @@
+"""Links kept up to date by `Mobility` are the links `build_adjacency` finds from scratch."""
+import copy
+import numpy as np
+import pytest
+import ofp_simulation
+from config import SimulationContext
+from mobility import Mobility, RandomWalk, RandomWaypoint
+from network_store import link_radius
+
+STEPS = 25
+
+
+def make_context(seed, is_random):
+    context = SimulationContext(seed=seed, node_count=300, area_width=1000, is_random=is_random)
+    ofp_simulation.setup_network(context)
+    return context
+
+
+def assert_links_exact(context):
+    store = context.network
+    scratch = copy.deepcopy(store)
+    scratch.build_adjacency(link_radius(context.transmission_range))
+    assert np.array_equal(store.offsets, scratch.offsets)
+    assert np.array_equal(store.indices, scratch.indices)
+    assert np.array_equal(store.neighbor_bits, scratch.neighbor_bits)
+
+
+def models(seed, transmission_range):
+    rng = np.random.default_rng(seed)
+    return {"walk": RandomWalk(rng, transmission_range / 10),
+            "fast walk": RandomWalk(rng, transmission_range / 2),
+            "waypoint": RandomWaypoint(rng, transmission_range / 20, transmission_range / 4, pause=2)}
+
+
+@pytest.mark.parametrize("seed", (0, 1, 2))
+@pytest.mark.parametrize("is_random", (False, True))
+@pytest.mark.parametrize("model", ("walk", "fast walk", "waypoint"))
+def test_links_after_steps(seed, is_random, model):
+    context = make_context(seed, is_random)
+    mobility = Mobility(context, models(seed, context.transmission_range)[model])
+    assert_links_exact(context)
+    for _ in range(STEPS):
+        mobility.step()
+        assert_links_exact(context)
+
+
+@pytest.mark.parametrize("skin", (0.05, 0.2, 1.0))
+def test_links_after_many_steps_with_any_skin(skin):
+    context = make_context(3, True)
+    mobility = Mobility(context, RandomWalk(np.random.default_rng(3), context.transmission_range / 10),
+                        skin=context.transmission_range * skin)
+    for _ in range(4 * STEPS):
+        mobility.step()
+    assert mobility.refreshed > 0
+    assert_links_exact(context)
+
+
+def test_still_step_keeps_the_lattice_links():
+    context = make_context(0, False)
+    links = context.network.indices.copy()
+    Mobility(context, RandomWalk(np.random.default_rng(0), 0.0)).step()
+    assert np.array_equal(context.network.indices, links)
+
+
+@pytest.mark.parametrize("seed", (0, 1))
+@pytest.mark.parametrize("topic", (None, "H"))
+def test_engines_agree_while_nodes_move(seed, topic):
+    results = []
+    for engine in ("vectorized", "reference"):
+        context = make_context(seed, True)
+        context.nodes[1].subscribed_topics = []  # So its topic floods spread
+        mobility = Mobility(context, RandomWalk(np.random.default_rng(seed), context.transmission_range / 2),
+                            dt=0.002)
+        ofp_simulation.send_new_message(1, topic, engine=engine, context=context,
+                                        progress=mobility.flood_progress(), progress_interval=mobility.dt)
+        assert mobility.steps > 0
+        results.append((context.transmitting_nodes, context.non_transmitting_nodes,
+                        context.network.nearest_tx.tolist()))
+    assert results[0] == results[1]
@@ -0,0 +1,39 @@
+"""The per-edge geometry is exactly what the reference engine computes per reception."""
+import math
+import numpy as np
+import pytest
+import network_store
+import ofp_simulation
+from config import SimulationContext
+
+
+@pytest.mark.parametrize("seed", (0, 1))
+@pytest.mark.parametrize("is_random", (False, True))
+@pytest.mark.parametrize("chunk", (7, network_store.GEOMETRY_CHUNK))
+def test_edge_geometry_matches_math_hypot(monkeypatch, seed, is_random, chunk):
+    monkeypatch.setattr(network_store, "GEOMETRY_CHUNK", chunk)
+    context = SimulationContext(seed=seed, node_count=200, area_width=700, is_random=is_random)
+    ofp_simulation.setup_network(context)
+    store = context.network
+    geometry = network_store.EdgeGeometry(store, context.transmission_range)
+
+    lengths, strategic = [], []
+    for sender in range(store.node_count):
+        center = (float(store.x[sender]), float(store.y[sender]))
+        vertices = ofp_simulation.strategic_points(center, context.transmission_range)
+        for receiver in store.neighbors_of(sender).tolist():
+            position = (float(store.x[receiver]), float(store.y[receiver]))
+            lengths.append(ofp_simulation.distance(position, center))
+            strategic.append(min(ofp_simulation.distance(position, vertex) for vertex in vertices))
+    assert geometry.edge_length.tolist() == lengths
+    assert geometry.edge_strategic.tolist() == strategic
+    assert np.array_equal(geometry.edge_delay, geometry.edge_strategic / (20 * context.transmission_range))
+
+
+def test_nearest_distance_breaks_near_ties_exactly():
+    rng = np.random.default_rng(0)
+    dx = rng.uniform(-1, 1, (1000, 6))
+    dx[:, 1] = -dx[:, 0]  # Ties of the squares in every row
+    dy = np.repeat(rng.uniform(-1, 1, (1000, 1)), 6, axis=1)
+    expected = [min(map(math.hypot, row_x, row_y)) for row_x, row_y in zip(dx.tolist(), dy.tolist())]
+    assert network_store.nearest_distance(dx, dy).tolist() == expected
@@ -0,0 +1,63 @@
+"""Cached floods come back exactly as a fresh flood would, also after topic edits."""
+import numpy as np
+import pytest
+import ofp_simulation
+import result_cache
+from config import SimulationContext
+from result_cache import ResultCache
+
+
+def outcome(context):
+    return (context.transmitting_nodes, context.non_transmitting_nodes, context.not_received_nodes,
+            context.network.nearest_tx.tolist(), context.network.transmitted.tolist(), context.event_count)
+
+
+def fresh(context, publisher, topic):
+    ofp_simulation.send_new_message(publisher, topic, context=context)
+    return outcome(context)
+
+
+@pytest.fixture(params=(0, 1, 2))
+def context(request):
+    context = SimulationContext(seed=request.param, node_count=150, area_width=800, is_random=True)
+    ofp_simulation.setup_network(context)
+    return context
+
+
+def test_repeated_flood_is_a_hit(context):
+    cache = ResultCache()
+    publisher = result_cache.send_message(cache, None, "H", context)
+    first = outcome(context)
+    ofp_simulation.send_new_message(publisher, None, context=context)  # Leave other state in the network
+    result_cache.send_message(cache, publisher, "H", context)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert outcome(context) == first == fresh(context, publisher, "H")
+
+
+def test_topic_edits_reuse_only_unaffected_floods(context):
+    cache = ResultCache()
+    rng = np.random.default_rng(context.seed)
+    publisher = result_cache.send_message(cache, None, None, context)
+    context.nodes[publisher].subscribed_topics = []  # A subscribed publisher's topic floods stop at once
+    for _ in range(40):
+        # Mostly edit nodes near the last flood, or it would never be affected
+        reached = np.flatnonzero(context.network.nearest_tx != np.inf)
+        node = int(rng.choice(reached if len(reached) and rng.random() < 0.7 else context.network.node_count))
+        topics = list(rng.choice(context.topics, rng.integers(0, 3), replace=False))
+        context.nodes[node + 1].subscribed_topics = topics
+        for topic in (None, "H", "E"):
+            result_cache.send_message(cache, publisher, topic, context)
+            assert outcome(context) == fresh(context, publisher, topic)
+    # Both outcomes of the staleness check were exercised
+    assert cache.hits > 40 and cache.misses > 3
+
+
+def test_moved_nodes_are_a_miss(context):
+    cache = ResultCache()
+    publisher = result_cache.send_message(cache, None, "H", context)
+    store = context.network
+    store.set_positions(store.y, store.x)  # Mirror the network
+    store.build_adjacency(context.transmission_range + 1e-6)
+    result_cache.send_message(cache, publisher, "H", context)
+    assert cache.misses == 2
+    assert outcome(context) == fresh(context, publisher, "H")
@@ -0,0 +1,37 @@
+"""The tuner only picks settings whose delivery is surely above the target, on every seed."""
+import json
+import pytest
+import tuner
+
+PARAMETERS = {"node_count": 120, "area_width": 500, "is_random": True}
+
+
+@pytest.mark.parametrize("target", (90.0, 95.0))
+def test_best_surely_delivers_on_every_seed(target):
+    result = tuner.tune(PARAMETERS, target=target, seeds=16)
+    assert result.best is not None
+    assert result.best["seeds"] == 16
+    assert result.best["delivery_bounds"][0] >= target
+    # Nothing evaluated on all seeds with fewer transmissions surely delivers too
+    for summary in result.pareto:
+        if summary["seeds"] == 16 and summary["transmission_ratio"] < result.best["transmission_ratio"]:
+            assert summary["delivery_bounds"][0] < target
+
+
+def test_unreachable_target_has_no_best():
+    result = tuner.tune(PARAMETERS, target=101.0, seeds=8)
+    assert result.best is None
+
+
+def test_main_takes_search_options(tmp_path):
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps({"target": 90, "parameters": PARAMETERS, "seeds": 8}))
+    outputs = []
+    for options in ([], ["--min-seeds", "8", "--refine-steps", "0"]):
+        output = tmp_path / "result.json"
+        tuner.main([str(spec), "--output", str(output)] + options)
+        outputs.append(json.loads(output.read_text()))
+    default, options = outputs
+    assert options["resolution"] == pytest.approx(0.1)  # No bisection
+    assert default["resolution"] < options["resolution"]
+    assert all(summary["seeds"] == 8 for summary in options["pareto"])  # Every candidate starts on all seeds
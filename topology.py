@@ -0,0 +1,210 @@
+"""Bulk, seeded generation of node placements and topic subscriptions.
+
+Everything is drawn from an explicit `numpy.random.Generator` and built as
+arrays, so a million-node network takes seconds and the same seed always
+gives the same network. Placements:
+
+- "uniform": independent uniform positions over the area.
+- "hex": the hexagonal lattice of `setup_network` (spacing = transmission
+  range), with any remaining nodes placed uniformly.
+- "poisson_disk": uniform positions at least `min_distance` apart.
+- "clustered": Gaussian clusters around uniform cluster centers.
+
+Usage:
+    context = SimulationContext(seed=7, placement="poisson_disk", node_count=1_000_000,
+                                area_width=100_000)
+    ofp_simulation.setup_network(context)
+
+`setup_network` uses this module whenever `context.placement` is set; the
+original `random`-module generator is kept for `placement=None`.
+"""
+import math
+import numpy as np
+from network_store import NetworkStore
+
+PUBLISHER_ONLY_RATIO = 0.05  # Share of nodes without topics, as in assign_random_topics
+
+
+def uniform_positions(rng, count, width):
+    """Return `count` uniform positions over the square area centered on the origin."""
+    x = rng.uniform(-width / 2, width / 2, count)
+    y = rng.uniform(-width / 2, width / 2, count)
+    return x, y
+
+
+def hex_positions(rng, count, width, spacing):
+    """Return the hexagonal lattice positions (row by row) topped up with uniform ones.
+
+    Returns:
+        tuple: (x, y, lattice_count), where the first `lattice_count` nodes are on the lattice.
+    """
+    row_height = spacing / 2 * math.sqrt(3)
+    rows = np.arange(int(width // row_height) + 1)
+    columns = np.arange(int(width // spacing) + 1)
+    x = (columns * spacing)[None, :] + (rows % 2 * (spacing / 2))[:, None] - width / 2
+    y = np.broadcast_to((rows * row_height)[:, None] - width / 2, x.shape)
+    inside = x <= width / 2
+    x, y = x[inside][:count], y[inside][:count]
+
+    fill_x, fill_y = uniform_positions(rng, count - len(x), width)
+    return np.concatenate((x, fill_x)), np.concatenate((y, fill_y)), len(x)
+
+
+def poisson_disk_positions(rng, count, width, min_distance=None, max_rounds=100):
+    """Return `count` uniform positions that are all at least `min_distance` apart.
+
+    Candidates are thrown in batches over a background grid with cells of
+    `min_distance / sqrt(2)`, so every cell holds at most one point and only
+    the 5x5 cells around a candidate can conflict with it. Within a batch, a
+    candidate loses to any earlier one it is too close to.
+
+    Args:
+        min_distance (float, optional): Defaults to 0.6 * width / sqrt(count), well
+            below the density at which dart throwing saturates.
+        max_rounds (int): Batches to try before giving up.
+
+    Raises:
+        ValueError: If `count` points could not be placed, i.e. `min_distance` is too large.
+    """
+    if min_distance is None:
+        min_distance = 0.6 * width / math.sqrt(max(count, 1))
+    cell_size = min_distance / math.sqrt(2)
+    cells = int(math.ceil(width / cell_size)) + 5  # Two free cells around the area
+    grid = np.full((cells, cells), -1, dtype=np.int64)
+    x, y = np.empty(count), np.empty(count)
+    placed = 0
+    # Cells two apart diagonally cannot hold points closer than min_distance
+    offsets = [(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if 0 < abs(dx) + abs(dy) < 4]
+
+    for _ in range(max_rounds):
+        if placed == count:
+            break
+        batch_x, batch_y = uniform_positions(rng, max(2 * (count - placed), 1024), width)
+        column = ((batch_x + width / 2) // cell_size).astype(np.int64) + 2
+        row = ((batch_y + width / 2) // cell_size).astype(np.int64) + 2
+        # Visit candidates in cell order for cache-friendly grid lookups; `rank` keeps the draw order
+        rank = np.argsort(column * cells + row, kind="stable")
+        batch_x, batch_y, column, row = batch_x[rank], batch_y[rank], column[rank], row[rank]
+
+        # Drop candidates too close to points placed in earlier batches
+        free = grid[column, row] < 0
+        for dx, dy in offsets:
+            other = grid[column + dx, row + dy]
+            near = other >= 0
+            near[near] = np.hypot(x[other[near]] - batch_x[near], y[other[near]] - batch_y[near]) < min_distance
+            free &= ~near
+
+        # Resolve conflicts inside the batch: the first drawn candidate of a cell owns it,
+        # and a candidate is dropped when an earlier drawn owner nearby is too close
+        free &= np.concatenate(([True], (column[1:] != column[:-1]) | (row[1:] != row[:-1])))
+        batch_x, batch_y, column, row, rank = batch_x[free], batch_y[free], column[free], row[free], rank[free]
+        batch_grid = np.full((cells, cells), -1, dtype=np.int64)
+        batch_grid[column, row] = np.arange(len(batch_x))
+        accepted = np.ones(len(batch_x), dtype=bool)
+        for dx, dy in offsets:
+            other = batch_grid[column + dx, row + dy]
+            near = other >= 0
+            near[near] = rank[other[near]] < rank[near]
+            near[near] = np.hypot(batch_x[other[near]] - batch_x[near], batch_y[other[near]] - batch_y[near]) < min_distance
+            accepted &= ~near
+
+        new = np.flatnonzero(accepted)
+        new = new[np.argsort(rank[new])][:count - placed]
+        x[placed:placed + len(new)], y[placed:placed + len(new)] = batch_x[new], batch_y[new]
+        grid[column[new], row[new]] = np.arange(placed, placed + len(new))
+        placed += len(new)
+
+    if placed < count:
+        raise ValueError(f"Could only place {placed} of {count} nodes {min_distance:g} apart; "
+                         "use a smaller min_distance or a larger area.")
+    return x, y
+
+
+def clustered_positions(rng, count, width, clusters=None, spread=None):
+    """Return positions drawn around uniform cluster centers (a Thomas process).
+
+    Each node picks a cluster uniformly and is offset from its center by a
+    normal draw with standard deviation `spread`; offsets that land outside the
+    area are redrawn.
+
+    Args:
+        clusters (int, optional): Number of clusters. Defaults to one per 100 nodes.
+        spread (float, optional): Defaults to width / (4 * sqrt(clusters)).
+    """
+    clusters = clusters or max(1, count // 100)
+    spread = spread or width / (4 * math.sqrt(clusters))
+    center_x, center_y = uniform_positions(rng, clusters, width)
+    membership = rng.integers(clusters, size=count)
+    x, y = center_x[membership], center_y[membership]
+    offset_x, offset_y = np.zeros(count), np.zeros(count)
+    redraw = np.arange(count)
+    while redraw.size:
+        offset_x[redraw] = rng.normal(0, spread, redraw.size)
+        offset_y[redraw] = rng.normal(0, spread, redraw.size)
+        px, py = x[redraw] + offset_x[redraw], y[redraw] + offset_y[redraw]
+        redraw = redraw[(np.abs(px) > width / 2) | (np.abs(py) > width / 2)]
+    return x + offset_x, y + offset_y
+
+
+PLACEMENTS = {
+    "uniform": uniform_positions,
+    "hex": hex_positions,
+    "poisson_disk": poisson_disk_positions,
+    "clustered": clustered_positions,
+}
+
+
+def random_subscriptions(rng, count, topic_count, chunk_size=1 << 22):
+    """Draw every node's topics at once, like `assign_random_topics` does per node.
+
+    A node has no topics with probability `PUBLISHER_ONLY_RATIO`; otherwise it
+    subscribes to k ~ U{1..topic_count} distinct topics in random order.
+
+    Returns:
+        tuple: (sub_offsets, sub_topics) in the CSR layout of `NetworkStore`.
+    """
+    publisher_only = rng.random(count) < PUBLISHER_ONLY_RATIO
+    lengths = rng.integers(1, topic_count + 1, count) if topic_count else np.zeros(count, dtype=np.int64)
+    lengths[publisher_only] = 0
+    sub_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(lengths, out=sub_offsets[1:])
+
+    # A random permutation per node (argsort of uniform keys), cut to its length.
+    # Rows are drawn in chunks to bound memory; the draws do not depend on the chunking.
+    sub_topics = []
+    rows = max(1, chunk_size // max(topic_count, 1))
+    for start in range(0, count, rows):
+        keys = rng.random((min(rows, count - start), topic_count))
+        permutations = np.argsort(keys, axis=1).astype(np.int32)
+        sub_topics.append(permutations[np.arange(topic_count) < lengths[start:start + rows, None]])
+    sub_topics = np.concatenate(sub_topics) if sub_topics else np.zeros(0, dtype=np.int32)
+    return sub_offsets, sub_topics
+
+
+def generate_store(rng, placement, count, width, transmission_range, topics, **options):
+    """Generate positions and subscriptions into a `NetworkStore` (without adjacency).
+
+    Args:
+        rng (numpy.random.Generator): Source of every random draw.
+        placement (str): One of `PLACEMENTS`.
+        count (int): Number of nodes.
+        width (float): Width of the square area, centered on the origin.
+        transmission_range (float): Lattice spacing of the "hex" placement.
+        topics (list): Topic names to subscribe to.
+        **options: Extra arguments of the placement function (e.g. `min_distance`).
+
+    Returns:
+        tuple: (store, lattice_count), where `lattice_count` is the number of
+        lattice nodes of the "hex" placement and 0 otherwise.
+    """
+    try:
+        place = PLACEMENTS[placement]
+    except KeyError:
+        raise ValueError(f"Unknown placement {placement!r}, expected one of {', '.join(PLACEMENTS)}.") from None
+
+    if placement == "hex":
+        x, y, lattice_count = place(rng, count, width, transmission_range, **options)
+    else:
+        (x, y), lattice_count = place(rng, count, width, **options), 0
+    sub_offsets, sub_topics = random_subscriptions(rng, count, len(topics))
+    return NetworkStore.from_arrays(x, y, topics, sub_offsets, sub_topics), lattice_count
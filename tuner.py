@@ -0,0 +1,327 @@
+"""Find the threshold ratio with the fewest transmissions that still delivers.
+
+`tune` searches `threshold_ratio` (and optionally `transmission_range`) for
+the setting with the lowest mean transmission ratio whose delivery ratio
+stays above a target, across seeds: over a topology distribution (every
+seed generates its own network) or over one snapshot (seeds only pick the
+publisher).
+
+Raising the threshold makes fewer nodes relay, so transmissions and
+delivery both fall as it grows. The search uses that in two phases:
+
+1. Successive halving over a coarse grid of candidates. All candidates
+   start with a few seeds. After each round, candidates whose delivery is
+   surely below the target are dropped. So are candidates that surely
+   transmit more than a candidate that surely delivers. The worse half of
+   the rest is dropped too, and the survivors get twice the seeds.
+2. Bisection of the threshold between the best candidate and the next
+   larger grid value that does not surely deliver. That value and each
+   midpoint get seeds until their delivery is surely above or below the
+   target (or the seeds run out).
+
+The best setting is the one with the fewest mean transmissions whose
+delivery is surely above the target, confirmed on all seeds; a mean above
+it is not enough.
+
+"Surely" means the normal confidence interval of the mean across seeds
+(`confidence`) is on one side. Every run shares networks across thresholds,
+and with `cache` finished runs come from a `RunCache` (see `run_cache.py`).
+
+Usage:
+    result = tune({"node_count": 200, "area_width": 600}, target=95, seeds=32)
+    result.best, result.pareto, result.runs
+
+    python tuner.py spec.json [--output result.json] [--min-seeds 8] [--refine-steps 6]
+"""
+import argparse
+import json
+import math
+from collections import OrderedDict
+from statistics import NormalDist, fmean, stdev
+from config import Config
+from result_cache import ResultCache
+from run_cache import RunCache
+import snapshot
+import sweep
+
+THRESHOLDS = (0.05, 0.15, 0.25, 0.35, 0.45, 0.55, 0.65, 0.75, 0.85, 0.95)  # Default coarse grid
+MIN_SEEDS = 4  # Seeds every candidate gets in the first round
+REFINE_STEPS = 4  # Bisection steps after the grid search
+MAX_NETWORKS = 64  # Networks kept for reuse across thresholds
+
+
+class Candidate:
+    """One (threshold_ratio, transmission_range) setting and its results so far, one per seed."""
+
+    def __init__(self, threshold_ratio, transmission_range):
+        self.threshold_ratio = threshold_ratio
+        self.transmission_range = transmission_range
+        self.delivery = []
+        self.transmission = []
+
+    def bounds(self, samples, z):
+        """Return (low, high) confidence bounds of the mean of `samples`."""
+        if len(samples) < 2:
+            return -math.inf, math.inf
+        margin = z * stdev(samples) / math.sqrt(len(samples))
+        mean = fmean(samples)
+        return mean - margin, mean + margin
+
+    def summary(self, z):
+        delivery_low, delivery_high = self.bounds(self.delivery, z)
+        transmission_low, transmission_high = self.bounds(self.transmission, z)
+        return {
+            "threshold_ratio": self.threshold_ratio,
+            "transmission_range": self.transmission_range,
+            "seeds": len(self.delivery),
+            "delivery_ratio": fmean(self.delivery),
+            "delivery_bounds": (delivery_low, delivery_high),
+            "transmission_ratio": fmean(self.transmission),
+            "transmission_bounds": (transmission_low, transmission_high),
+        }
+
+
+class TuneResult:
+    """Outcome of `tune`.
+
+    Attributes:
+        best (dict): Summary of the chosen setting (see `Candidate.summary`), or None if no
+            evaluated setting surely reached the target (lower delivery bound below it).
+        pareto (list[dict]): Summaries of the evaluated settings no other one beats on both
+            mean transmission ratio and mean delivery ratio, by transmission ratio.
+        runs (int): Floods run (cached runs excluded).
+        evaluations (int): (setting, seed) points evaluated, cached or not.
+        resolution (float): Threshold step the search resolved the best setting to.
+        grid_evaluations (int): Points a full sweep over every seed would take at that
+            resolution, over the span of the grid.
+    """
+
+    def __init__(self, best, pareto, runs, evaluations, resolution, grid_evaluations):
+        self.best = best
+        self.pareto = pareto
+        self.runs = runs
+        self.evaluations = evaluations
+        self.resolution = resolution
+        self.grid_evaluations = grid_evaluations
+
+    def to_dict(self):
+        return {"best": self.best, "pareto": self.pareto, "runs": self.runs, "evaluations": self.evaluations,
+                "resolution": self.resolution, "grid_evaluations": self.grid_evaluations}
+
+
+class Evaluator:
+    """Runs (setting, seed) points as sweep runs, reusing each seed's network across thresholds."""
+
+    def __init__(self, parameters, topic=None, snapshot_path=None, cache=None):
+        self.parameters = dict({name: getattr(Config, name) for name in sweep.PARAMETERS}, **parameters)
+        self.topic = topic
+        self.snapshot_path = snapshot_path
+        self.cache = RunCache(cache) if cache else None
+        self.networks = OrderedDict()
+        self.floods = {}
+        self.runs = 0
+        self.evaluations = 0
+
+    def __call__(self, candidate, seed):
+        """Add the delivery and transmission ratios of `candidate` on `seed` to its results."""
+        run = dict(self.parameters, threshold_ratio=candidate.threshold_ratio,
+                   transmission_range=candidate.transmission_range, seed=seed, topic=self.topic,
+                   publisher=None, snapshot=self.snapshot_path)
+        self.evaluations += 1
+        key = sweep.run_key(run) if self.cache is not None else None
+        row = self.cache.get(key) if key is not None else None
+        if row is None:
+            network = self.network(run)
+            network[0].threshold_ratio = candidate.threshold_ratio - Config.epsilon
+            row = sweep.run_single(run, network, self.floods[id(network[0])])
+            self.runs += 1
+            if key is not None:
+                self.cache.put(key, row, network[0])
+        candidate.delivery.append(row["delivery_ratio"])
+        candidate.transmission.append(row["transmission_ratio"])
+
+    def network(self, run):
+        """Return the (context, publisher) of a run's network, set up once per seed and range."""
+        key = (run["seed"], run["transmission_range"])
+        network = self.networks.get(key)
+        if network is None:
+            network = self.networks[key] = sweep.setup_run(run)
+            self.floods[id(network[0])] = ResultCache()
+            while len(self.networks) > MAX_NETWORKS:
+                old_context, _ = self.networks.popitem(last=False)[1]
+                del self.floods[id(old_context)]
+        self.networks.move_to_end(key)
+        return network
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+
+def pareto_front(summaries):
+    """Return the summaries not beaten on both mean transmission and mean delivery, by transmission."""
+    front = []
+    for summary in sorted(summaries, key=lambda s: (s["transmission_ratio"], -s["delivery_ratio"])):
+        if not front or summary["delivery_ratio"] > front[-1]["delivery_ratio"]:
+            front.append(summary)
+    return front
+
+
+def tune(parameters=None, target=95.0, thresholds=THRESHOLDS, ranges=None, seeds=32, topic=None,
+         snapshot_path=None, confidence=0.95, min_seeds=MIN_SEEDS, refine_steps=REFINE_STEPS, cache=None):
+    """Search the threshold ratio (and range) with the fewest transmissions at `target` delivery.
+
+    Args:
+        parameters (dict, optional): Fixed sweep parameters (node_count, area_width, ...).
+        target (float): Delivery ratio to keep, in percent.
+        thresholds (sequence): Coarse grid of threshold ratios, as in the GUI (without epsilon).
+        ranges (sequence, optional): Transmission ranges to try. Defaults to the parameters' range.
+        seeds (int or sequence): Seeds to evaluate on, at most; an int means `range(seeds)`.
+        topic (str, optional): Tune topic floods instead of plain OFP.
+        snapshot_path (str, optional): Tune on this snapshot; seeds then only pick the publisher.
+        confidence (float): Confidence of the bounds that drop candidates and settle bisection steps.
+        min_seeds (int): Seeds per candidate in the first round.
+        refine_steps (int): Bisection steps after the grid search.
+        cache (str, optional): `RunCache` file to take finished runs from and add new ones to.
+
+    Returns:
+        TuneResult
+    """
+    parameters = dict(parameters or {})
+    unknown = set(parameters) - set(sweep.PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown tuning parameters: {', '.join(sorted(unknown))}")
+    if snapshot_path:
+        fixed = snapshot.read_meta(snapshot_path)["parameters"]
+        if ranges is not None and set(ranges) != {fixed["transmission_range"]}:
+            raise ValueError("The transmission range is fixed by the snapshot and cannot be tuned.")
+        parameters.update((name, value) for name, value in fixed.items() if name in sweep.PARAMETERS)
+    seeds = list(range(seeds) if isinstance(seeds, int) else seeds)
+    ranges = list(ranges or [parameters.get("transmission_range", Config.transmission_range)])
+    thresholds = sorted(thresholds)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    evaluate = Evaluator(parameters, topic, snapshot_path, cache)
+    candidates = [Candidate(threshold, transmission_range) for transmission_range in ranges
+                  for threshold in thresholds]
+
+    def delivers(candidate):
+        """True / False once the delivery bounds are on one side of the target, else None."""
+        low, high = candidate.bounds(candidate.delivery, z)
+        return True if low >= target else False if high < target else None
+
+    def settle(candidate):
+        """Add seeds to `candidate` until its delivery is surely above or below the target."""
+        for seed in seeds[len(candidate.delivery):]:
+            if len(candidate.delivery) >= min_seeds and delivers(candidate) is not None:
+                break
+            evaluate(candidate, seed)
+
+    def confirm(candidate):
+        """Evaluate `candidate` on every seed and return whether it still surely delivers."""
+        for seed in seeds[len(candidate.delivery):]:
+            evaluate(candidate, seed)
+        return delivers(candidate)
+
+    try:
+        # Successive halving over the grid
+        alive = list(candidates)
+        count = min(min_seeds, len(seeds))
+        while True:
+            for seed in seeds[len(alive[0].delivery):count]:
+                for candidate in alive:
+                    evaluate(candidate, seed)
+            alive = [candidate for candidate in alive if delivers(candidate) is not False]
+            sure = [candidate for candidate in alive if delivers(candidate)]
+            if sure:
+                ceiling = min(candidate.bounds(candidate.transmission, z)[1] for candidate in sure)
+                alive = [candidate for candidate in alive if candidate.bounds(candidate.transmission, z)[0] <= ceiling]
+            if len(alive) <= 1 or count == len(seeds):
+                break
+            # Keep the better half: likely feasible first, then by mean transmissions
+            alive.sort(key=lambda c: (fmean(c.delivery) < target, fmean(c.transmission)))
+            alive = alive[:max(1, (len(alive) + 1) // 2)]
+            count = min(count * 2, len(seeds))
+
+        # The likely feasible settings get seeds, fewest transmissions first, until one surely delivers
+        best = None
+        likely = [candidate for candidate in candidates if candidate.delivery and fmean(candidate.delivery) >= target]
+        for candidate in sorted(likely, key=lambda c: fmean(c.transmission)):
+            settle(candidate)
+            if delivers(candidate):
+                best = candidate
+                break
+
+        # Bisection between the best setting and the next larger threshold of the grid. Halving
+        # may have dropped that one on a few unlucky seeds, so settle it first and move up
+        # while it still surely delivers.
+        resolution = min((b - a for a, b in zip(thresholds, thresholds[1:])), default=0.0)
+        if best is not None:
+            grid = {candidate.threshold_ratio: candidate for candidate in candidates
+                    if candidate.transmission_range == best.transmission_range}
+            low, high = best.threshold_ratio, None
+            for threshold in thresholds:
+                if threshold <= low:
+                    continue
+                candidate = grid[threshold]
+                settle(candidate)
+                if not delivers(candidate):
+                    high = threshold
+                    break
+                low = threshold
+                if fmean(candidate.transmission) <= fmean(best.transmission):
+                    best = candidate
+            for _ in range(refine_steps if high is not None else 0):
+                candidate = Candidate((low + high) / 2, best.transmission_range)
+                candidates.append(candidate)
+                settle(candidate)
+                if delivers(candidate):
+                    low = candidate.threshold_ratio
+                    if fmean(candidate.transmission) <= fmean(best.transmission):
+                        best = candidate
+                else:
+                    high = candidate.threshold_ratio
+                resolution /= 2
+
+        # Confirm the pick on every seed: on a few seeds that all deliver fully, delivery looks sure
+        # by luck. Settings that fail the confirmation give way to the next fewest transmissions.
+        ranked = sorted((candidate for candidate in candidates if delivers(candidate)),
+                        key=lambda c: fmean(c.transmission))
+        best = next((candidate for candidate in ranked if confirm(candidate)), None)
+    finally:
+        evaluate.close()
+
+    summaries = [candidate.summary(z) for candidate in candidates if candidate.delivery]
+    points = round((thresholds[-1] - thresholds[0]) / resolution) + 1 if resolution else len(thresholds)
+    return TuneResult(best.summary(z) if best is not None else None, pareto_front(summaries), evaluate.runs,
+                      evaluate.evaluations, resolution, points * len(ranges) * len(seeds))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the OFP threshold ratio for a delivery target.")
+    parser.add_argument("spec", help="JSON spec: target, parameters, thresholds, ranges, seeds, topic, snapshot, "
+                                     "confidence, min_seeds, refine_steps")
+    parser.add_argument("--output", metavar="FILE", help="Write the result JSON here instead of stdout")
+    parser.add_argument("--cache", metavar="FILE", help="Persistent result cache (SQLite) to reuse runs from")
+    parser.add_argument("--min-seeds", type=int, help=f"Seeds per candidate in the first round (default {MIN_SEEDS})")
+    parser.add_argument("--refine-steps", type=int,
+                        help=f"Bisection steps after the grid search (default {REFINE_STEPS})")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    result = tune(spec.get("parameters"), spec.get("target", 95.0), spec.get("thresholds", THRESHOLDS),
+                  spec.get("ranges"), spec.get("seeds", 32), spec.get("topic"), spec.get("snapshot"),
+                  spec.get("confidence", 0.95),
+                  args.min_seeds if args.min_seeds is not None else spec.get("min_seeds", MIN_SEEDS),
+                  args.refine_steps if args.refine_steps is not None else spec.get("refine_steps", REFINE_STEPS),
+                  args.cache)
+    text = json.dumps(result.to_dict(), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import math
+import numpy as np
+import flood_trace
+from scheduler import PROGRESS_INTERVAL, PUBLISH, TRANSMIT, make_scheduler
+
+
+def flood(store, source_index, topic, threshold, transmission_range, scheduler="heap", stats=None,
+          progress=None, progress_interval=PROGRESS_INTERVAL, trace=None):
+    """Flood one message from `source_index`, leaving the outcome in the store's message state.
+
+    Makes the same decisions, in the same order, as `Node.receive_message` and
+    `Node.transmit_message`, but handles all receivers of a transmission at
+    once: distance updates, threshold discards and forwarding checks are array
+    masks over the sender's CSR row, and delays come from the precomputed
+    per-edge geometry. A `FloodStats` passed as `stats` gets the counters and
+    the initial broadcast / event loop timings, a `TraceWriter` passed as
+    `trace` the flood's records. `progress(current_time)` is called about
+    every `progress_interval` of simulated time, with every earlier event
+    already applied to the store.
+
+    Returns:
+        int: Number of events processed.
+    """
+    geometry = store.geometry(transmission_range)
+    columns = store.topic_columns(topic)
+    if columns is not None:
+        subscribed, neighbors_subscribed, topic_bit = columns
+    source_x, source_y = store.x[source_index], store.y[source_index]
+    event_queue = make_scheduler(scheduler)
+    event_id = 0
+
+    def transmit(sender, current_time):
+        nonlocal event_id
+        edges = np.arange(store.offsets[sender], store.offsets[sender + 1])
+        receivers = store.indices[edges]
+        if stats is not None:
+            stats.receptions += len(edges)
+        alive = ~store.transmitted[receivers]
+        edges, receivers = edges[alive], receivers[alive]
+        dn = np.minimum(store.nearest_tx[receivers], geometry.edge_length[edges])
+        store.nearest_tx[receivers] = dn
+        if trace is not None:
+            trace.record_many(flood_trace.RECEIVE, current_time, receivers, sender, dn)
+
+        # Threshold discards; every surviving reception takes an event ID
+        passing = dn >= threshold
+        if trace is not None:
+            trace.record_many(flood_trace.DISCARD, current_time, receivers[~passing], sender, dn[~passing])
+        edges, receivers = edges[passing], receivers[passing]
+        if stats is not None:
+            stats.threshold_discards += len(passing) - len(edges)
+        event_ids = np.arange(event_id, event_id + len(receivers))
+        event_id += len(receivers)
+
+        if columns is not None:
+            forward = ((subscribed[receivers] & topic_bit) == 0) & ((neighbors_subscribed[receivers] & topic_bit) != 0)
+            if stats is not None:
+                stats.topic_rejections += len(forward) - int(np.count_nonzero(forward))
+            edges, receivers, event_ids = edges[forward], receivers[forward], event_ids[forward]
+        elif topic is not None:
+            if stats is not None:
+                stats.topic_rejections += len(receivers)
+            return  # Nobody subscribes to the topic, so nobody forwards it
+        if len(receivers):
+            from_source = store.x[sender] == source_x and store.y[sender] == source_y
+            delays = (geometry.source_delay if from_source else geometry.edge_delay)[edges]
+            if trace is not None:
+                trace.record_many(flood_trace.SCHEDULE, current_time, receivers, sender, current_time + delays,
+                                  event_ids)
+            for time, receiver_event_id, receiver in zip((current_time + delays).tolist(), event_ids.tolist(),
+                                                        receivers.tolist()):
+                event_queue.push((time, receiver_event_id, receiver, TRANSMIT, 0))
+
+    store.transmitted[source_index] = True
+    if trace is not None:
+        trace.record(flood_trace.TRANSMIT, 0.0, source_index)
+    if columns is None or not subscribed[source_index] & topic_bit:
+        transmit(source_index, 0.0)
+    if stats is not None:
+        stats.lap("initial_broadcast")
+
+    next_report = progress_interval
+    while event_queue:
+        current_time, _, node, _, _ = event_queue.pop()
+        if progress is not None and current_time >= next_report:
+            progress(current_time)
+            next_report = current_time + progress_interval
+            # The callback may have moved nodes (see mobility.py)
+            geometry = store.geometry(transmission_range)
+            source_x, source_y = store.x[source_index], store.y[source_index]
+        if store.transmitted[node] or columns is not None and subscribed[node] & topic_bit:
+            if stats is not None:
+                stats.duplicate_suppressions += 1
+            continue
+        store.transmitted[node] = True
+        store.nearest_tx[node] = 0
+        if trace is not None:
+            trace.record(flood_trace.TRANSMIT, current_time, node)
+        transmit(node, current_time)
+    if stats is not None:
+        stats.lap("event_loop")
+        stats.events_pushed, stats.events_popped = event_queue.pushed, event_queue.popped
+    return event_queue.popped
+
+
+class MessageFlood:
+    """One message in a concurrent flood, with sparse per-message state.
+
+    Only nodes the message reaches get entries in `transmitted` (node indices)
+    and `nearest_tx` (node index -> distance to the nearest transmitter), so
+    starting a message costs nothing per node in the network.
+    """
+    __slots__ = ("message_id", "source", "topic", "start_time", "transmitted", "nearest_tx", "node_count")
+
+    def __init__(self, message_id, source, topic=None, start_time=0.0, node_count=0):
+        self.message_id = message_id
+        self.source = source
+        self.topic = topic
+        self.start_time = start_time
+        self.transmitted = set()
+        self.nearest_tx = {}
+        self.node_count = node_count
+
+    @property
+    def source_node_id(self):
+        return self.source + 1
+
+    @property
+    def transmitting_nodes(self):
+        return sorted(index + 1 for index in self.transmitted)
+
+    @property
+    def non_transmitting_nodes(self):
+        return sorted(index + 1 for index in self.nearest_tx if index not in self.transmitted)
+
+    @property
+    def not_received_nodes(self):
+        """IDs of nodes the message never reached (the only O(n) result)."""
+        return [index + 1 for index in range(self.node_count) if index not in self.nearest_tx]
+
+
+def flood_many(store, messages, threshold, transmission_range, scheduler="heap"):
+    """Flood several `MessageFlood`s concurrently on one shared event timeline.
+
+    Each message makes exactly the decisions `flood` would make for it alone;
+    events of all messages are interleaved by time in a single heap. Delays
+    accumulate on each message's own clock (time since its start), which also
+    breaks ties (events carry `(time since start, event ID)` as their seq), so
+    shifting a message's start never reorders its events.
+    """
+    geometry = store.geometry(transmission_range)
+    offsets, indices = store.offsets.tolist(), store.indices.tolist()
+    lengths = geometry.edge_length.tolist()
+    edge_delay, source_delay = geometry.edge_delay.tolist(), geometry.source_delay.tolist()
+    x, y = store.x.tolist(), store.y.tolist()
+    event_queue = make_scheduler(scheduler)
+    event_id = 0
+
+    for number, message in enumerate(messages):
+        event_queue.push((message.start_time, (0.0, event_id), message.source, PUBLISH, number))
+        event_id += 1
+
+    def transmit(number, sender, current_time):
+        nonlocal event_id
+        message = messages[number]
+        transmitted, nearest_tx, source = message.transmitted, message.nearest_tx, message.source
+        columns = store.topic_columns(message.topic)
+        from_source = x[sender] == x[source] and y[sender] == y[source]
+        delays = source_delay if from_source else edge_delay
+        for edge in range(offsets[sender], offsets[sender + 1]):
+            receiver = indices[edge]
+            if receiver in transmitted:
+                continue
+            dn = nearest_tx.get(receiver, math.inf)
+            dist = lengths[edge]
+            if dist < dn:
+                nearest_tx[receiver] = dn = dist
+            if dn < threshold:
+                continue
+            receiver_event_id = event_id
+            event_id += 1
+            if message.topic is not None and not (
+                    columns is not None and
+                    not columns[0][receiver] & columns[2] and columns[1][receiver] & columns[2]):
+                continue
+            time = current_time + delays[edge]
+            event_queue.push((message.start_time + time, (time, receiver_event_id), receiver, TRANSMIT, number))
+
+    while event_queue:
+        _, (current_time, _), node, kind, number = event_queue.pop()
+        message = messages[number]
+        columns = store.topic_columns(message.topic)
+        subscriber = columns is not None and columns[0][node] & columns[2]
+        if kind == PUBLISH:
+            message.transmitted.add(node)
+            if not subscriber:
+                transmit(number, node, current_time)
+            continue
+        if node in message.transmitted or subscriber:
+            continue
+        message.transmitted.add(node)
+        message.nearest_tx[node] = 0
+        transmit(number, node, current_time)
+    return messages